@@ -4,30 +4,164 @@ from utils import (
     validate_config,
     validate_request,
     generate_app_code,
-    create_or_update_repo,
-    update_readme,
+    generate_readme,
+    get_existing_code,
+    get_repo_urls,
     notify_evaluation_api,
 )
+from utils.code_generator import get_generation_stats
+from utils.config import ASYNC_JOBS, GITHUB_WEBHOOK_SECRET, IDEMPOTENCY_WAIT_TIMEOUT
+from utils.github_manager import prepare_repo, deploy_to_repo
+from utils.pipeline import PipelineError, Stage, run_pipeline
 from utils.evidence import send_evidence_log
+from utils.idempotency import IN_FLIGHT, get_idempotency_store, idempotency_key
+from utils.jobs import JobQueueFull, get_job_manager
+from utils.task_locks import StaleRoundError, TaskLockTimeout, get_task_locks
+from utils.webhooks import handle_github_event, verify_signature
 
 app = Flask(__name__)
 
 
+def _wants_async() -> bool:
+    mode = request.args.get("async")
+    if mode is None:
+        return ASYNC_JOBS
+    return mode.lower() in ("1", "true", "yes")
+
+
 @app.route("/api-endpoint", methods=["POST"])
 def handle_request():
-    current_step = "initialization"
-    data = None
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"status": "error", "message": "No JSON data provided"}), 400
+
+    is_valid, message = validate_request(data)
+    if not is_valid:
+        return jsonify({"status": "error", "message": message}), 400
+
+    req_ip = request.remote_addr
+    req_url = request.url
+    wants_async = _wants_async()
+
+    store = get_idempotency_store()
+    key = None
+    if store is not None:
+        key = idempotency_key(data)
+        record = store.begin(key)
+        if record is not None and record["state"] == IN_FLIGHT and not wants_async:
+            print(f"Duplicate delivery for task {data.get('task', '')}, waiting for the original run...")
+            store.wait(key, IDEMPOTENCY_WAIT_TIMEOUT)
+            # None again if the original run failed: this delivery runs it instead
+            record = store.begin(key)
+        if record is not None:
+            return _replay_response(record)
+
+    if not wants_async:
+        response_data, status_code = _run_request(key, data, req_ip, req_url)
+        return jsonify(response_data), status_code
 
     try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"status": "error", "message": "No JSON data provided"}), 400
+        job = get_job_manager().submit(
+            lambda job: _run_request(key, data, req_ip, req_url, job),
+            metadata={
+                "task": data.get("task", ""),
+                "round": data.get("round", 1),
+            },
+        )
+    except JobQueueFull as e:
+        if key is not None:
+            store.abandon(key)
+        return jsonify({"status": "error", "message": str(e)}), 503
+
+    if key is not None:
+        store.set_job(key, job.id)
+    print(f"Queued job {job.id} for task: {data.get('task', '')}")
+    return (
+        jsonify(
+            {
+                "status": "accepted",
+                "job_id": job.id,
+                "status_url": f"/jobs/{job.id}",
+            }
+        ),
+        202,
+    )
+
+
+def _replay_response(record):
+    """Answer a duplicate delivery from its idempotency record."""
+    if record["state"] != IN_FLIGHT:
+        print("Duplicate delivery, returning the stored response")
+        return jsonify(record["response"]), record["status_code"]
+    if record["job_id"]:
+        return (
+            jsonify(
+                {
+                    "status": "accepted",
+                    "job_id": record["job_id"],
+                    "status_url": f"/jobs/{record['job_id']}",
+                }
+            ),
+            202,
+        )
+    return (
+        jsonify(
+            {
+                "status": "error",
+                "message": "This request is already being processed, try again later",
+            }
+        ),
+        409,
+    )
+
+
+def _run_request(key, data, req_ip=None, req_url=None, job=None):
+    """process_request() that records its outcome in the idempotency store."""
+    store = get_idempotency_store()
+    if key is None or store is None:
+        return process_request(data, req_ip, req_url, job)
+    try:
+        response_data, status_code = process_request(data, req_ip, req_url, job)
+    except BaseException:
+        store.abandon(key)
+        raise
+    store.finish(key, response_data, status_code)
+    return response_data, status_code
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+
+def process_request(data, req_ip=None, req_url=None, job=None):
+    """
+    Run the full build/revise pipeline for an already validated request.
 
-        current_step = "validation"
-        is_valid, message = validate_request(data)
-        if not is_valid:
-            return jsonify({"status": "error", "message": message}), 400
+    Independent stages run concurrently: repository preparation and README
+    generation overlap with fetching existing code and code generation.
 
+    Returns:
+        Tuple of (response_dict, http_status_code)
+    """
+    current_step = "initialization"
+    # Filled by the stages themselves: generation stats live in thread-local
+    # state of the worker thread that ran the stage, not of this one
+    stage_details = {}
+
+    def on_stage_start(name):
+        if job is not None:
+            job.start_stage(name)
+
+    def on_stage_finish(name, status, error):
+        if job is None:
+            return
+        job.finish_stage(name, status, error, details=stage_details.get(name))
+
+    try:
         email = data.get("email", "")
         task = data.get("task", "")
         round_num = data.get("round", 1)
@@ -39,12 +173,10 @@ def handle_request():
 
         print(f"Processing request for {email}, task: {task}, round: {round_num}")
 
-        existing_code = ""
-        if round_num > 1:
-            current_step = "fetching existing code"
+        def fetch_existing_code(results):
+            if round_num <= 1:
+                return ""
             try:
-                from utils.github_manager import get_existing_code
-
                 existing_code = get_existing_code(task)
                 if existing_code:
                     print(
@@ -52,48 +184,94 @@ def handle_request():
                     )
                 else:
                     print(
-                        "No existing code found (this is OK for first-time Round {round_num})"
+                        f"No existing code found (this is OK for first-time Round {round_num})"
                     )
+                return existing_code or ""
             except Exception as e:
                 print(f"Warning: Could not fetch existing code: {str(e)}")
                 print("Continuing without existing code (generating fresh)...")
+                return ""
 
-        current_step = "generating code"
-        print("Generating app code with LLM...")
-        try:
-            code_files = generate_app_code(
-                brief, checks, attachments, existing_code, round_num
-            )
-        except Exception as e:
-            return jsonify({"status": "error", "message": f"Code generation failed: {str(e)}"}), 500
-
-        current_step = "creating/updating repository"
-        print("Creating/updating GitHub repository...")
-        try:
-            repo_info = create_or_update_repo(task, code_files, round_num)
-        except Exception as e:
-            return jsonify({"status": "error", "message": f"Repository operation failed: {str(e)}"}), 500
-
-        current_step = "updating README"
-        print("Updating README...")
-        try:
-            update_readme(
-                repo_info["repo"],
-                task,
-                brief,
-                repo_info["repo_url"],
-                repo_info["pages_url"],
+        def generate_code(results):
+            print("Generating app code with LLM...")
+            try:
+                return generate_app_code(
+                    brief, checks, attachments, results["fetching existing code"], round_num
+                )
+            finally:
+                stage_details["generating code"] = get_generation_stats()
+
+        def generate_readme_file(results):
+            print("Generating README...")
+            try:
+                repo_url, pages_url = get_repo_urls(task)
+                readme_content = generate_readme(task, brief, repo_url, pages_url)
+                if not readme_content:
+                    print("Warning: No README content generated, skipping update")
+                return readme_content
+            except Exception as e:
+                print(f"Warning: README generation failed: {str(e)}")
+                return ""
+
+        def prepare_repository(results):
+            print("Preparing GitHub repository...")
+            return prepare_repo(task, round_num)
+
+        def deploy(results):
+            print("Deploying to GitHub repository...")
+            code_files = dict(results["generating code"])
+            if results["generating README"]:
+                code_files["README.md"] = results["generating README"]
+            return deploy_to_repo(
+                results["preparing repository"], task, code_files, round_num
             )
-        except Exception as e:
-            print(f"Warning: README update failed: {str(e)}")
 
-        current_step = "fetching commit info"
+        stages = [
+            Stage("fetching existing code", fetch_existing_code),
+            Stage("generating code", generate_code, deps=["fetching existing code"]),
+            Stage("generating README", generate_readme_file),
+            Stage("preparing repository", prepare_repository),
+            Stage(
+                "creating/updating repository",
+                deploy,
+                deps=["generating code", "generating README", "preparing repository"],
+            ),
+        ]
+
+        current_step = "running pipeline"
+        task_locks = get_task_locks()
         try:
-            commits = repo_info["repo"].get_commits()
-            latest_commit_sha = commits[0].sha
-        except Exception as e:
-            print(f"Warning: Could not fetch commits: {str(e)}")
-            latest_commit_sha = repo_info.get("commit_sha", "unknown")
+            # One deployment per task at a time, lowest round first
+            with task_locks.hold(task, round_num):
+                results, timings = run_pipeline(
+                    stages,
+                    max_workers=len(stages),
+                    on_stage_start=on_stage_start,
+                    on_stage_finish=on_stage_finish,
+                )
+                # A failed commit falls back to the old head; don't let it block retries
+                if results["creating/updating repository"].get("deployed"):
+                    task_locks.mark_deployed(task, round_num)
+        except StaleRoundError as e:
+            print(f"Rejecting stale request: {str(e)}")
+            return {"status": "error", "message": str(e)}, 409
+        except TaskLockTimeout as e:
+            return {"status": "error", "message": str(e)}, 503
+        except PipelineError as e:
+            current_step = e.stage
+            if e.stage == "generating code":
+                return {"status": "error", "message": f"Code generation failed: {str(e)}"}, 500
+            if e.stage in ("preparing repository", "creating/updating repository"):
+                return {"status": "error", "message": f"Repository operation failed: {str(e)}"}, 500
+            raise e.error
+
+        print(
+            "Stage timings: "
+            + ", ".join(f"{name} {seconds:.1f}s" for name, seconds in timings.items())
+        )
+
+        repo_info = results["creating/updating repository"]
+        latest_commit_sha = repo_info.get("commit_sha", "unknown")
 
         eval_data = {
             "email": email,
@@ -106,12 +284,14 @@ def handle_request():
         }
 
         current_step = "notifying evaluation API"
+        on_stage_start(current_step)
         print("Notifying evaluation API...")
         notify_result = False
         try:
             notify_result = notify_evaluation_api(evaluation_url, eval_data)
         except Exception as e:
             print(f"Warning: Evaluation API notification failed: {str(e)}")
+        on_stage_finish(current_step, "completed" if notify_result else "failed", None)
 
         response_data = {
             "status": "success",
@@ -124,11 +304,11 @@ def handle_request():
             response_data["warning"] = "Failed to notify evaluation API after retries"
 
         try:
-            send_evidence_log(data, response_data, request.remote_addr, request.url)
+            send_evidence_log(data, response_data, req_ip, req_url)
         except Exception as log_error:
             print(f"Warning: Failed to log to Google Sheets: {str(log_error)}")
 
-        return jsonify(response_data), 200
+        return response_data, 200
 
     except Exception as e:
         print(f"Error processing request at step '{current_step}': {str(e)}")
@@ -136,6 +316,9 @@ def handle_request():
 
         traceback.print_exc()
 
+        if job is not None:
+            job.finish_stage(current_step, "failed", str(e))
+
         error_message = str(e)
         if current_step != "initialization":
             error_message = f"Failed at step '{current_step}': {error_message}"
@@ -157,12 +340,34 @@ def handle_request():
 
         try:
             if data:
-                send_evidence_log(data, error_response, request.remote_addr, request.url)
+                send_evidence_log(data, error_response, req_ip, req_url)
                 print("logged for evidence")
         except Exception as log_error:
             print(f"logged for evidence failed: {str(log_error)}")
 
-        return jsonify(error_response), 500
+        return error_response, 500
+
+
+@app.route("/webhooks/github", methods=["POST"])
+def github_webhook():
+    if not GITHUB_WEBHOOK_SECRET:
+        return jsonify({"status": "error", "message": "Webhooks are not configured"}), 404
+
+    body = request.get_data()
+    if not verify_signature(body, request.headers.get("X-Hub-Signature-256")):
+        return jsonify({"status": "error", "message": "Invalid signature"}), 401
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"status": "error", "message": "Invalid JSON payload"}), 400
+
+    event = request.headers.get("X-GitHub-Event", "")
+    try:
+        result = handle_github_event(event, payload)
+    except Exception as e:
+        print(f"Error handling {event} webhook: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+    return jsonify({"status": "success", **result}), 200
 
 
 @app.route("/health", methods=["GET"])
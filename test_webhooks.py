@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Replays signed GitHub webhook deliveries against a running server, standing in
+for GitHub. Start the API with GITHUB_WEBHOOK_SECRET set, then:
+
+    python test_webhooks.py                         # signature and ping checks
+    python test_webhooks.py owner/repo <commit-sha> # also report that build as finished
+
+Run the second form while a deployment of owner/repo is waiting for Pages to
+see the wait end as soon as the page_build event arrives.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import sys
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+B_URL = "http://localhost:5000"
+WEBHOOK_URL = B_URL + "/webhooks/github"
+WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+
+
+def sign(body: bytes, secret: str = WEBHOOK_SECRET) -> str:
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def deliver(event: str, payload: dict, signature: str = None) -> requests.Response:
+    body = json.dumps(payload).encode("utf-8")
+    headers = {
+        "Content-Type": "application/json",
+        "X-GitHub-Event": event,
+        "X-GitHub-Delivery": "replay-" + hashlib.sha1(body).hexdigest()[:12],
+        "X-Hub-Signature-256": signature if signature is not None else sign(body),
+    }
+    response = requests.post(WEBHOOK_URL, data=body, headers=headers, timeout=10)
+    print(f"{event}: {response.status_code} {response.text.strip()}")
+    return response
+
+
+def page_build_payload(full_name: str, commit: str, status: str = "built") -> dict:
+    return {
+        "id": 1,
+        "build": {
+            "url": f"https://api.github.com/repos/{full_name}/pages/builds/1",
+            "status": status,
+            "error": {"message": None},
+            "commit": commit,
+            "duration": 12345,
+        },
+        "repository": {"full_name": full_name},
+    }
+
+
+def push_payload(full_name: str, after: str) -> dict:
+    return {
+        "ref": "refs/heads/main",
+        "before": "0" * 40,
+        "after": after,
+        "repository": {"full_name": full_name},
+    }
+
+
+def test_signatures():
+    print("\n=== Signature checks ===")
+    ok = deliver("ping", {"zen": "Keep it logically awesome."}).status_code == 200
+    rejected = deliver("ping", {"zen": "forged"}, signature="sha256=" + "0" * 64).status_code == 401
+    unsigned = deliver("ping", {"zen": "unsigned"}, signature="").status_code == 401
+    print("✅ Signatures verified" if ok and rejected and unsigned else "❌ Signature checks failed")
+    return ok and rejected and unsigned
+
+
+def test_replay(full_name: str, commit: str):
+    print(f"\n=== Replaying events for {full_name} at {commit[:7]} ===")
+    building = deliver("page_build", page_build_payload(full_name, commit, status="building"))
+    built = deliver("page_build", page_build_payload(full_name, commit))
+    pushed = deliver("push", push_payload(full_name, commit))
+    if all(r.status_code == 200 for r in (building, built, pushed)):
+        woken = built.json().get("woken", 0)
+        print(f"✅ Events accepted, {woken} waiting deployment(s) completed")
+        return True
+    print("❌ Replay failed")
+    return False
+
+
+def main():
+    if not WEBHOOK_SECRET:
+        print("GITHUB_WEBHOOK_SECRET is not set, nothing to sign deliveries with")
+        sys.exit(1)
+
+    try:
+        requests.get(B_URL + "/health", timeout=5)
+    except requests.exceptions.RequestException:
+        print(f"Server is not reachable at {B_URL}")
+        sys.exit(1)
+
+    passed = test_signatures()
+    if len(sys.argv) >= 3:
+        passed = test_replay(sys.argv[1], sys.argv[2]) and passed
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
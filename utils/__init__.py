@@ -1,7 +1,7 @@
 from .config import load_config, get_github_client, get_openai_client, validate_config
 from .validation import verify_secret, validate_request
 from .code_generator import generate_app_code, generate_readme
-from .github_manager import create_or_update_repo, update_readme, get_existing_code
+from .github_manager import create_or_update_repo, update_readme, get_existing_code, get_repo_urls
 from .api_notifier import notify_evaluation_api
 
 __all__ = [
@@ -16,5 +16,6 @@ __all__ = [
     'create_or_update_repo',
     'update_readme',
     'get_existing_code',
+    'get_repo_urls',
     'notify_evaluation_api'
 ]
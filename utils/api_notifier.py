@@ -2,14 +2,17 @@ import time
 from typing import Dict, Any
 import requests
 
+from .config import get_http_session
+
 
 def notify_evaluation_api(
     evaluation_url: str, data: Dict[str, Any], max_retries: int = 5
 ) -> bool:
+    http = get_http_session()
     delay = 1
     for attempt in range(max_retries):
         try:
-            response = requests.post(
+            response = http.post(
                 evaluation_url,
                 json=data,
                 headers={"Content-Type": "application/json"},
@@ -0,0 +1,193 @@
+"""
+Local content-addressed store of deployed files.
+Every deployment records the committed files as zlib-compressed blobs named by
+their git blob SHA plus a small per-task manifest (owner, commit SHA, ETag of the
+branch ref), so later rounds can read back our own output without GitHub reads.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional, Union
+
+from .config import ARTIFACT_STORE_DIR, ARTIFACT_STORE_MAX_BYTES
+
+
+def git_blob_sha(content: Union[str, bytes]) -> str:
+    """SHA-1 git assigns to a blob with this content."""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    header = f"blob {len(content)}\0".encode("ascii")
+    return hashlib.sha1(header + content).hexdigest()
+
+
+class ArtifactStore:
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        Args:
+            directory: Root directory for blobs and manifests
+            max_bytes: Compressed size above which least recently used blobs are evicted
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._objects = os.path.join(directory, "objects")
+        self._manifests_dir = os.path.join(directory, "manifests")
+        self._manifests: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self._objects, exist_ok=True)
+        os.makedirs(self._manifests_dir, exist_ok=True)
+
+    def _blob_path(self, sha: str) -> str:
+        return os.path.join(self._objects, f"{sha}.z")
+
+    def _manifest_path(self, task: str) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in task)
+        return os.path.join(self._manifests_dir, f"{safe}.json")
+
+    def _write_atomic(self, path: str, data: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def put_blob(self, content: Union[str, bytes]) -> str:
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        sha = git_blob_sha(content)
+        path = self._blob_path(sha)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            self._write_atomic(path, zlib.compress(content))
+        return sha
+
+    def get_blob(self, sha: str) -> Optional[bytes]:
+        path = self._blob_path(sha)
+        try:
+            with open(path, "rb") as f:
+                content = zlib.decompress(f.read())
+            os.utime(path)
+        except (OSError, zlib.error):
+            return None
+        if git_blob_sha(content) != sha:
+            print(f"Warning: Discarding corrupt artifact {sha[:12]}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return content
+
+    def record_deployment(
+        self,
+        task: str,
+        owner: str,
+        commit_sha: str,
+        files: Dict[str, Union[str, bytes]],
+    ) -> Dict[str, Any]:
+        """Store files and remember them as the content of task at commit_sha."""
+        manifest = {
+            "task": task,
+            "owner": owner,
+            "commit_sha": commit_sha,
+            "etag": None,
+            "files": {path: self.put_blob(content) for path, content in files.items()},
+            "recorded_at": time.time(),
+        }
+        self._save_manifest(task, manifest)
+        self._evict()
+        return manifest
+
+    def get_manifest(self, task: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            manifest = self._manifests.get(task)
+        if manifest is not None:
+            return manifest
+        try:
+            with open(self._manifest_path(task), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._manifests[task] = manifest
+        return manifest
+
+    def update_etag(self, task: str, etag: Optional[str]) -> None:
+        manifest = self.get_manifest(task)
+        if manifest is None or not etag or manifest.get("etag") == etag:
+            return
+        self._save_manifest(task, {**manifest, "etag": etag})
+
+    def forget(self, task: str) -> None:
+        with self._lock:
+            self._manifests.pop(task, None)
+        try:
+            os.remove(self._manifest_path(task))
+        except OSError:
+            pass
+
+    def read_file(self, task: str, path: str) -> Optional[bytes]:
+        manifest = self.get_manifest(task)
+        if manifest is None or path not in manifest["files"]:
+            return None
+        return self.get_blob(manifest["files"][path])
+
+    def _save_manifest(self, task: str, manifest: Dict[str, Any]) -> None:
+        self._write_atomic(
+            self._manifest_path(task), json.dumps(manifest).encode("utf-8")
+        )
+        with self._lock:
+            self._manifests[task] = manifest
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self._objects):
+                if not name.endswith(".z"):
+                    continue
+                path = os.path.join(self._objects, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+
+_artifact_store = None
+_artifact_store_lock = threading.Lock()
+
+
+def get_artifact_store() -> Optional[ArtifactStore]:
+    """Shared store, or None when ARTIFACT_STORE_DIR is empty or unusable."""
+    global _artifact_store
+    if _artifact_store is None and ARTIFACT_STORE_DIR:
+        with _artifact_store_lock:
+            if _artifact_store is None:
+                try:
+                    _artifact_store = ArtifactStore(
+                        ARTIFACT_STORE_DIR, ARTIFACT_STORE_MAX_BYTES
+                    )
+                except OSError as e:
+                    print(f"Warning: Artifact store disabled: {str(e)}")
+                    return None
+    return _artifact_store
@@ -4,9 +4,18 @@ Prevents LLM token limit issues and improves page load performance.
 """
 import re
 import base64
-from typing import List, Tuple
+import binascii
+from typing import Callable, Dict, List, Tuple
 from github import GithubException
 
+from .artifact_store import git_blob_sha
+
+# A base64 data URI anywhere in the document: attribute values, CSS url(),
+# srcset candidates and JS/JSON strings (where "/" may be escaped as "\/")
+DATA_URI_PATTERN = re.compile(
+    r'data:([\w.+-]+/[\w.+-]+)((?:;[\w.+-]+=[^;,\s"\'()]*)*);base64,((?:[A-Za-z0-9+/]|\\/)+={0,2})'
+)
+
 
 def extract_data_uris(html: str, size_threshold: int = 10000) -> List[Tuple[str, str, str]]:
     """
@@ -19,13 +28,11 @@ def extract_data_uris(html: str, size_threshold: int = 10000) -> List[Tuple[str,
     Returns:
         List of tuples: (full_data_uri, mime_type, base64_data)
     """
-    pattern = r'data:([^;,]+);base64,([A-Za-z0-9+/=]+)'
-    
     matches = []
-    for match in re.finditer(pattern, html):
+    for match in DATA_URI_PATTERN.finditer(html):
         full_uri = match.group(0)
         mime_type = match.group(1)
-        base64_data = match.group(2)
+        base64_data = match.group(3)
         
         estimated_size = len(base64_data) * 3 // 4
         
@@ -83,6 +90,14 @@ def mime_to_extension(mime_type: str) -> str:
     return 'bin'
 
 
+def asset_filename(mime_type: str, content: bytes) -> str:
+    """
+    Content-addressed asset path. Identical content always gets the same name,
+    so unchanged assets are never re-uploaded and browsers can cache them.
+    """
+    return f"assets/{git_blob_sha(content)[:16]}.{mime_to_extension(mime_type)}"
+
+
 def upload_asset_to_repo(repo, filename: str, content: bytes, message: str = None) -> str:
     """
     Upload a file to GitHub repository root.
@@ -101,6 +116,9 @@ def upload_asset_to_repo(repo, filename: str, content: bytes, message: str = Non
     try:
         try:
             existing_file = repo.get_contents(filename, ref="main")
+            if existing_file.sha == git_blob_sha(content):
+                print(f"Asset unchanged, skipping upload: {filename}")
+                return filename
             repo.update_file(
                 path=filename,
                 message=message,
@@ -127,58 +145,88 @@ def upload_asset_to_repo(repo, filename: str, content: bytes, message: str = Non
         raise
 
 
-def process_html_assets(html: str, repo, round_num: int = 1) -> str:
+def rewrite_data_uris(
+    html: str,
+    name_asset: Callable[[str, bytes], str],
+    size_threshold: int = 10000,
+) -> Tuple[str, List[Tuple[str, bytes]]]:
+    """
+    Replace every large data URI in html with a file name in a single pass.
+    Identical URIs (same MIME type and content) map to the same asset.
+
+    Args:
+        html: Document to rewrite
+        name_asset: Called with (mime_type, content) for each distinct asset,
+            returns the relative path to use in its place
+        size_threshold: Minimum decoded size in bytes to extract
+
+    Returns:
+        Tuple of (rewritten html, list of (filename, content))
+    """
+    assets: List[Tuple[str, bytes]] = []
+    names: Dict[Tuple[str, str], str] = {}
+
+    def replace(match) -> str:
+        base64_data = match.group(3)
+        if len(base64_data) * 3 // 4 < size_threshold:
+            return match.group(0)
+        base64_data = base64_data.replace("\\/", "/")
+        mime_type = match.group(1)
+        # The MIME type picks the extension, so the same bytes may need two files
+        filename = names.get((mime_type, base64_data))
+        if filename is not None:
+            return filename
+
+        try:
+            content = base64.b64decode(base64_data, validate=True)
+        except (binascii.Error, ValueError) as e:
+            print(f"Warning: Failed to decode {mime_type} data URI: {str(e)}")
+            return match.group(0)
+
+        filename = name_asset(mime_type, content)
+        names[(mime_type, base64_data)] = filename
+        assets.append((filename, content))
+        print(f"✅ Replaced {mime_type} data URI (~{len(content)} bytes) with: {filename}")
+        return filename
+
+    return DATA_URI_PATTERN.sub(replace, html), assets
+
+
+def process_html_assets(html: str, repo, round_num: int = 1, writer=None) -> str:
     """
     Extract large data URIs from HTML, upload them to GitHub, and replace with relative paths.
     
     Args:
         html: Original HTML content with data URIs
         repo: PyGithub repository object
-        round_num: Round number for file naming
+        round_num: Round number used in commit messages
+        writer: Optional DeploymentWriter; assets are staged on it for the
+            deployment commit instead of being uploaded one commit at a time
     
     Returns:
         Modified HTML with data URIs replaced by relative paths
     """
-    data_uris = extract_data_uris(html, size_threshold=10000)
+    rewritten, assets = rewrite_data_uris(html, asset_filename, size_threshold=10000)
     
-    if not data_uris:
+    if not assets:
         print("No large data URIs found in HTML")
         return html
     
-    print(f"Processing {len(data_uris)} large data URI(s)...")
-    
-    asset_counter = {}
+    print(f"Processing {len(assets)} large data URI(s)...")
     
-    for full_uri, mime_type, base64_data in data_uris:
-        try:
-            content = base64.b64decode(base64_data)
-            
-            extension = mime_to_extension(mime_type)
-            
-            if extension not in asset_counter:
-                asset_counter[extension] = 0
-            asset_counter[extension] += 1
-            
-            if asset_counter[extension] == 1:
-                filename = f"asset_round{round_num}_{extension.replace('.', '')}.{extension}"
-            else:
-                filename = f"asset_round{round_num}_{extension.replace('.', '')}{asset_counter[extension]}.{extension}"
-            
+    for filename, content in assets:
+        if writer is not None:
+            writer.add_file(filename, content)
+        else:
+            extension = filename.rsplit(".", 1)[-1]
             upload_asset_to_repo(
                 repo=repo,
                 filename=filename,
                 content=content,
                 message=f"Add {extension.upper()} asset for round {round_num}"
             )
-            
-            html = html.replace(full_uri, filename)
-            print(f"✅ Replaced data URI with: {filename}")
-            
-        except Exception as e:
-            print(f"Warning: Failed to process asset {mime_type}: {str(e)}")
-            continue
-    
-    return html
+    
+    return rewritten
 
 
 def test_asset_handler():
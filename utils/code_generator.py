@@ -1,7 +1,390 @@
-from typing import Dict, Optional
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
 
-from .config import get_openai_client, get_fallback_client
-from .file_handler import process_all_attachments
+from .cache import DiskCache, LRUCache, TieredCache, make_cache_key
+from .config import (
+    get_openai_client,
+    get_fallback_client,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_SIZE,
+    LLM_CACHE_DIR,
+    LLM_CACHE_MAX_BYTES,
+    LLM_STREAMING,
+    LLM_HEDGING,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_INITIAL_DELAY,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_HEDGE_MAX_DELAY,
+    FALLBACK_API_KEY,
+    LLM_PATCH_MODE,
+)
+from .file_handler import attachment_detail_levels
+from .patcher import PatchError, apply_search_replace, parse_search_replace, verify_html
+from .prompt_budget import PromptComponent, plan_prompt
+
+PRIMARY_MODEL = "gemini-2.5-flash"
+FALLBACK_MODEL = "gpt-4"
+TEMPERATURE = 0.7
+
+APP_SYSTEM_PROMPT = "You are an expert web developer. Generate clean, functional, production-ready HTML applications that pass all specified checks."
+README_SYSTEM_PROMPT = "You are an expert at writing professional technical documentation."
+PATCH_SYSTEM_PROMPT = "You are an expert web developer. Revise existing HTML applications with minimal, precise SEARCH/REPLACE edits so they pass all specified checks."
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+_generation_stats = threading.local()
+_ttft_history = deque(maxlen=100)
+_ttft_lock = threading.Lock()
+
+
+def get_llm_cache() -> TieredCache:
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                disk = None
+                if LLM_CACHE_DIR:
+                    disk = DiskCache(LLM_CACHE_DIR, LLM_CACHE_MAX_BYTES)
+                _llm_cache = TieredCache(
+                    LRUCache(max_entries=LLM_CACHE_SIZE),
+                    disk,
+                    sizeof=len,
+                )
+    return _llm_cache
+
+
+class HtmlFenceExtractor:
+    """
+    Incrementally strips the markdown fence around a streamed HTML document.
+    A fence counts only when it comes before the first tag; the document then
+    ends at a closing fence right after </html> and the rest of the stream can
+    be dropped (a fence line inside a script string is not followed that way).
+    Unfenced output is read to the end and cut after its last </html>, since
+    an earlier one may sit inside a script string.
+    """
+
+    def __init__(self):
+        self.raw = ""
+        self.done = False
+        self.fenced = False
+        self._body_start: Optional[int] = None
+        self._body_end: Optional[int] = None
+        self._scan_from = 0
+
+    def _find_body_start(self) -> Optional[int]:
+        fence = self.raw.find("```")
+        tag = self.raw.find("<")
+        if fence != -1 and (tag == -1 or fence < tag):
+            newline = self.raw.find("\n", fence)
+            if newline == -1:
+                return None
+            self.fenced = True
+            return newline + 1
+        # Any text before the first tag is a preamble, not part of the document
+        return tag if tag != -1 else None
+
+    def feed(self, chunk: str) -> bool:
+        """Add streamed text. Returns True once the rest of the stream can be dropped."""
+        if self.done:
+            return True
+        self.raw += chunk
+
+        if self._body_start is None:
+            self._body_start = self._find_body_start()
+            if self._body_start is None:
+                return False
+            self._scan_from = self._body_start
+        if not self.fenced:
+            return False
+
+        # Re-scan a few characters back so a fence split across chunks is found
+        scan_from = max(self._body_start, self._scan_from - 4)
+        self._scan_from = len(self.raw)
+        closing_fence = self.raw.find("\n```", scan_from)
+        while closing_fence != -1:
+            if self.raw[self._body_start : closing_fence].rstrip().lower().endswith("</html>"):
+                self._body_end = closing_fence
+                self.done = True
+                break
+            closing_fence = self.raw.find("\n```", closing_fence + 1)
+        return self.done
+
+    def result(self) -> str:
+        if self._body_start is None:
+            return self.raw.strip()
+        if self.fenced:
+            end = self._body_end
+            if end is None:
+                # Stream ended without a fence after </html>, take the last one
+                end = self.raw.rfind("\n```", self._body_start)
+                end = end if end != -1 else None
+            return self.raw[self._body_start : end].strip()
+        body = self.raw[self._body_start :]
+        html_end = body.lower().rfind("</html>")
+        if html_end != -1:
+            body = body[: html_end + len("</html>")]
+        return body.strip()
+
+
+def get_generation_stats() -> Dict[str, Any]:
+    """Timing of the last streamed generation made by the current thread."""
+    return dict(getattr(_generation_stats, "value", {}) or {})
+
+
+class _StreamCancel:
+    """Lets one thread abort another thread's streaming completion."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.stream = None
+
+    def cancel(self) -> None:
+        self.event.set()
+        stream = self.stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+
+def _record_ttft(seconds: float) -> None:
+    with _ttft_lock:
+        _ttft_history.append(seconds)
+
+
+def get_hedge_delay() -> float:
+    """
+    Seconds to wait for the primary model's first token before hedging with the
+    fallback: the configured percentile of observed primary TTFTs, clamped.
+    """
+    with _ttft_lock:
+        samples = sorted(_ttft_history)
+    if len(samples) < 5:
+        return LLM_HEDGE_INITIAL_DELAY
+    index = min(len(samples) - 1, int(LLM_HEDGE_PERCENTILE * len(samples)))
+    return min(max(samples[index], LLM_HEDGE_MIN_DELAY), LLM_HEDGE_MAX_DELAY)
+
+
+def _stream_html_completion(
+    client,
+    model: str,
+    messages: list,
+    cancel: Optional[_StreamCancel] = None,
+    on_first_token=None,
+) -> Tuple[Optional[str], Dict[str, Any]]:
+    extractor = HtmlFenceExtractor()
+    start = time.time()
+    first_token_at = None
+    chunks = 0
+
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=TEMPERATURE,
+        stream=True,
+    )
+    if cancel is not None:
+        cancel.stream = stream
+    try:
+        for chunk in stream:
+            if cancel is not None and cancel.event.is_set():
+                break
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if first_token_at is None:
+                first_token_at = time.time()
+                if on_first_token is not None:
+                    on_first_token(first_token_at - start)
+            chunks += 1
+            if extractor.feed(delta):
+                break
+    finally:
+        stream.close()
+
+    end = time.time()
+    generation_time = end - (first_token_at or end)
+    approx_tokens = len(extractor.raw) // 4
+    stats = {
+        "model": model,
+        "time_to_first_token": (first_token_at - start) if first_token_at else None,
+        "total_time": end - start,
+        "chunks": chunks,
+        "approx_tokens": approx_tokens,
+        "tokens_per_second": approx_tokens / generation_time if generation_time > 0 else None,
+        "stopped_early": extractor.done,
+    }
+    if cancel is not None and cancel.event.is_set():
+        print(f"Cancelled stream from {model} after {stats['total_time']:.1f}s")
+        return None, stats
+    if first_token_at is None:
+        print(f"Stream from {model} returned no content")
+    else:
+        print(
+            f"Streamed ~{approx_tokens} tokens from {model} in {stats['total_time']:.1f}s "
+            f"(TTFT {stats['time_to_first_token']:.1f}s, {chunks} chunks)"
+        )
+
+    return extractor.result() or None, stats
+
+
+def _hedged_html_completion(messages: list) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Stream from the primary model; if it has not produced a first token within
+    get_hedge_delay() seconds (or fails), race the fallback model against it.
+    The first complete document wins and the other stream is cancelled.
+    """
+    results: "queue.Queue" = queue.Queue()
+    primary_first_token = threading.Event()
+    cancels: Dict[str, _StreamCancel] = {}
+
+    def on_primary_first_token(ttft: float) -> None:
+        _record_ttft(ttft)
+        primary_first_token.set()
+
+    def run(name: str, client_getter, model: str, on_first_token=None) -> None:
+        try:
+            html, stats = _stream_html_completion(
+                client_getter(), model, messages, cancels[name], on_first_token
+            )
+            results.put((name, html, stats, None))
+        except Exception as e:
+            results.put((name, None, {}, e))
+
+    def launch(name: str, client_getter, model: str, on_first_token=None) -> None:
+        cancels[name] = _StreamCancel()
+        threading.Thread(
+            target=run,
+            args=(name, client_getter, model, on_first_token),
+            name=f"llm-{name}",
+            daemon=True,
+        ).start()
+
+    delay = get_hedge_delay()
+    hedge_at = time.time() + delay
+    launch("primary", get_openai_client, PRIMARY_MODEL, on_primary_first_token)
+    timer_expired = False
+    pending = 1
+    last_error: Optional[BaseException] = None
+
+    while pending:
+        waiting_for_hedge = not timer_expired and "fallback" not in cancels
+        timeout = max(0.0, hedge_at - time.time()) if waiting_for_hedge else None
+        try:
+            name, html, stats, error = results.get(timeout=timeout)
+        except queue.Empty:
+            timer_expired = True
+            if not primary_first_token.is_set():
+                print(
+                    f"No first token from {PRIMARY_MODEL} after {delay:.1f}s, hedging with {FALLBACK_MODEL}..."
+                )
+                launch("fallback", get_fallback_client, FALLBACK_MODEL)
+                pending += 1
+            continue
+
+        pending -= 1
+        if error is None and html:
+            for other, cancel in cancels.items():
+                if other != name:
+                    cancel.cancel()
+            stats["hedged"] = "fallback" in cancels
+            stats["winner"] = name
+            return html, stats
+
+        if error is not None:
+            print(f"{name.capitalize()} LLM stream failed: {str(error)}")
+            last_error = error
+        if "fallback" not in cancels:
+            print(f"Falling back to {FALLBACK_MODEL}...")
+            launch("fallback", get_fallback_client, FALLBACK_MODEL)
+            pending += 1
+
+    if last_error is not None:
+        raise last_error
+    return None, {}
+
+
+def _chat_completion(
+    system_prompt: str, prompt: str, stream_html: bool = False
+) -> Tuple[Optional[str], str]:
+    """Returns (response text, model that produced it)."""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt},
+    ]
+
+    if stream_html and LLM_HEDGING and FALLBACK_API_KEY:
+        html, stats = _hedged_html_completion(messages)
+        _generation_stats.value = stats
+        model = FALLBACK_MODEL if stats.get("winner") == "fallback" else PRIMARY_MODEL
+        return html, model
+
+    try:
+        if stream_html:
+            html, stats = _stream_html_completion(
+                get_openai_client(), PRIMARY_MODEL, messages,
+                on_first_token=_record_ttft,
+            )
+            _generation_stats.value = stats
+            return html, PRIMARY_MODEL
+        response = get_openai_client().chat.completions.create(
+            model=PRIMARY_MODEL,
+            messages=messages,
+            temperature=TEMPERATURE,
+        )
+    except Exception:
+        if stream_html:
+            html, stats = _stream_html_completion(
+                get_fallback_client(), FALLBACK_MODEL, messages
+            )
+            _generation_stats.value = stats
+            return html, FALLBACK_MODEL
+        response = get_fallback_client().chat.completions.create(
+            model=FALLBACK_MODEL,
+            messages=messages,
+            temperature=TEMPERATURE,
+        )
+        return response.choices[0].message.content, FALLBACK_MODEL
+    return response.choices[0].message.content, PRIMARY_MODEL
+
+
+def complete(
+    system_prompt: str, prompt: str, stream_html: bool = False
+) -> Optional[str]:
+    """
+    Chat completion with primary → fallback failover, served from the LLM
+    response cache when the exact same model/system/user prompt was seen before.
+    Concurrent identical prompts share a single in-flight call. Responses
+    produced by the fallback model are not cached, since the cache key names
+    the primary model.
+
+    With stream_html the response is streamed and cut off as soon as the HTML
+    document is complete; the fence-stripped document is returned.
+    """
+    if not LLM_CACHE_ENABLED:
+        return _chat_completion(system_prompt, prompt, stream_html)[0]
+
+    cache = get_llm_cache()
+    key = make_cache_key(PRIMARY_MODEL, TEMPERATURE, system_prompt, prompt)
+    cached = cache.get(key)
+    if cached is not None:
+        print(f"LLM cache hit ({key[:12]})")
+        return cached
+    produced_by = {}
+
+    def compute() -> Optional[str]:
+        text, produced_by["model"] = _chat_completion(system_prompt, prompt, stream_html)
+        return text
+
+    return cache.get_or_compute(
+        key, compute, cache_if=lambda _: produced_by.get("model") == PRIMARY_MODEL
+    )
 
 
 def generate_app_code(
@@ -11,16 +394,149 @@ def generate_app_code(
     existing_code: Optional[str] = None,
     round_num: int = 1,
 ) -> Dict[str, str]:
-    client = get_openai_client()
-
-    attachments_info = process_all_attachments(attachments)
+    _generation_stats.value = {}
     checks = checks or []
 
-    existing_context = ""
+    # Attachments give way first, the previous round's code only as a last resort
+    components = [
+        PromptComponent(f"attachment:{i}", attachment_detail_levels(att, i), priority=0)
+        for i, att in enumerate(attachments or [], 1)
+    ]
     if existing_code and round_num > 1:
-        existing_context = f"""\n\nEXISTING CODE FROM ROUND {round_num - 1}:\n```html\n{existing_code}\n```\n\nIMPORTANT: Modify and enhance the existing code above according to the new brief below. Preserve all working functionality from previous rounds unless the brief explicitly asks to change it.\n"""
+        components.append(
+            PromptComponent(
+                "existing code",
+                [
+                    ("full", _existing_code_context(existing_code, round_num)),
+                    ("compact", _existing_code_context(_compact_code(existing_code), round_num)),
+                ],
+                priority=1,
+            )
+        )
 
-    prompt = f"""Generate a complete, minimal single-page web application based on this brief:{existing_context}
+    fixed_prompt = _app_prompt(brief, checks, "", "")
+    planned, prompt_stats = plan_prompt(fixed_prompt, components)
+    if prompt_stats["downgraded"]:
+        print(
+            f"Prompt budget: ~{prompt_stats['prompt_tokens_estimate']}/{prompt_stats['prompt_budget_tokens']} tokens, reduced "
+            + ", ".join(f"{name} to {level}" for name, level in prompt_stats["downgraded"].items())
+        )
+
+    attachments_info = ""
+    if attachments:
+        attachments_info = "\n\n=== ATTACHMENTS ===\n" + "".join(
+            planned[f"attachment:{i}"].text for i in range(1, len(attachments) + 1)
+        )
+    existing_context = planned["existing code"].text if "existing code" in planned else ""
+
+    if existing_context and LLM_PATCH_MODE:
+        # Edits always apply to the original document; when the model only saw
+        # the compact view, its SEARCH lines still match line by line since
+        # indentation and blank lines are ignored there
+        patched, patch_stats = _revise_with_patches(
+            existing_code, brief, checks, existing_context, attachments_info
+        )
+        prompt_stats.update(patch_stats)
+        if patched is not None:
+            _generation_stats.value = {**get_generation_stats(), **prompt_stats}
+            return {"index.html": patched}
+        print("Falling back to regenerating the full document...")
+
+    prompt = _app_prompt(brief, checks, existing_context, attachments_info)
+    html_content = complete(APP_SYSTEM_PROMPT, prompt, stream_html=LLM_STREAMING)
+    _generation_stats.value = {**get_generation_stats(), **prompt_stats}
+
+    if html_content is None:
+        print("No HTML content generated.")
+        return {"index.html": ""}
+
+    if "```html" in html_content:
+        html_content = html_content.split("```html")[1].split("```")[0].strip()
+    elif "```" in html_content:
+        html_content = html_content.split("```")[1].split("```")[0].strip()
+
+    return {"index.html": html_content}
+
+
+def _revise_with_patches(
+    base_code: str,
+    brief: str,
+    checks: list,
+    existing_context: str,
+    attachments_info: str,
+) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Ask for SEARCH/REPLACE edits against base_code and apply them locally, so
+    output size follows the size of the change rather than of the app.
+
+    Returns:
+        Tuple of (patched document or None if the edits were unusable, stats)
+    """
+    prompt = _patch_prompt(brief, checks, existing_context, attachments_info)
+    started = time.time()
+    try:
+        response = complete(PATCH_SYSTEM_PROMPT, prompt)
+    except Exception as e:
+        print(f"Warning: Patch generation failed: {str(e)}")
+        return None, {"revision_mode": "full", "patch_error": str(e)}
+
+    stats: Dict[str, Any] = {"patch_seconds": round(time.time() - started, 3)}
+    try:
+        edits = parse_search_replace(response or "")
+        patched = apply_search_replace(base_code, edits)
+        verify_html(base_code, patched)
+    except PatchError as e:
+        print(f"Warning: Could not apply patch: {str(e)}")
+        stats.update({"revision_mode": "full", "patch_error": str(e)})
+        return None, stats
+
+    print(f"Applied {len(edits)} edit(s) to the existing code ({len(response)} chars of output)")
+    stats.update({"revision_mode": "patch", "patch_edits": len(edits)})
+    return patched, stats
+
+
+def _patch_prompt(brief: str, checks: list, existing_context: str, attachments_info: str) -> str:
+    return f"""Revise the existing single-page web application below to satisfy this brief.{existing_context}
+
+Brief: {brief}
+
+Evaluation Checks (must all pass):
+{chr(10).join(["- " + check for check in checks])}
+{attachments_info}
+
+Respond ONLY with one or more edit blocks in exactly this format:
+
+<<<<<<< SEARCH
+lines copied exactly from the existing code
+=======
+the new lines that replace them
+>>>>>>> REPLACE
+
+Rules:
+1. Each SEARCH section must match the existing code exactly once; include enough surrounding lines to make it unique
+2. Keep SEARCH sections short: only the lines that change plus minimal context
+3. To add code, SEARCH for a nearby line (e.g. </body> or </script>) and repeat it in REPLACE together with the new code
+4. Blocks are applied in order to the result of the previous block
+5. The revised app must satisfy ALL evaluation checks and keep working features unless the brief changes them
+6. If attachments are provided as data URIs, embed them directly in the HTML
+7. No explanations, no markdown fences, nothing outside the edit blocks"""
+
+
+def _existing_code_context(existing_code: str, round_num: int) -> str:
+    return f"""\n\nEXISTING CODE FROM ROUND {round_num - 1}:\n```html\n{existing_code}\n```\n\nIMPORTANT: Modify and enhance the existing code above according to the new brief below. Preserve all working functionality from previous rounds unless the brief explicitly asks to change it.\n"""
+
+
+def _compact_code(code: str) -> str:
+    """
+    Prompt-only view of code with indentation and blank lines dropped. This is
+    lossy for whitespace-sensitive content (<pre>, <textarea>, template
+    literals), so it must never be deployed or used as the base for patches.
+    """
+    return "\n".join(line.strip() for line in code.splitlines() if line.strip())
+
+
+def _app_prompt(brief: str, checks: list, existing_context: str, attachments_info: str) -> str:
+    return f"""Generate a complete, minimal single-page web application based on this brief:{existing_context}
 
 Brief: {brief}
 
@@ -42,49 +558,8 @@ Critical Requirements:
 
 Return ONLY the complete HTML code with no explanations, no comments, no markdown formatting."""
 
-    try:
-        response = client.chat.completions.create(
-            model="gemini-2.5-flash",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert web developer. Generate clean, functional, production-ready HTML applications that pass all specified checks.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-        )
-        html_content = response.choices[0].message.content
-    except Exception:
-        fallback_client = get_fallback_client()
-        response = fallback_client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert web developer. Generate clean, functional, production-ready HTML applications that pass all specified checks.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-        )
-        html_content = response.choices[0].message.content
-
-    if html_content is None:
-        print("No HTML content generated.")
-        return {"index.html": ""}
-
-    if "```html" in html_content:
-        html_content = html_content.split("```html")[1].split("```")[0].strip()
-    elif "```" in html_content:
-        html_content = html_content.split("```")[1].split("```")[0].strip()
-
-    return {"index.html": html_content}
-
 
 def generate_readme(task: str, brief: str, repo_url: str, pages_url: str) -> str:
-    client = get_openai_client()
-
     prompt = f"""Generate a professional README.md for this project:
 
 Task: {task}
@@ -102,33 +577,7 @@ The README should include:
 
 Make it clear, professional, and well-structured with proper markdown formatting."""
 
-    try:
-        response = client.chat.completions.create(
-            model="gemini-2.5-flash",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert at writing professional technical documentation.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-        )
-        readme_content = response.choices[0].message.content
-    except Exception:
-        fallback_client = get_fallback_client()
-        response = fallback_client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert at writing professional technical documentation.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-        )
-        readme_content = response.choices[0].message.content
+    readme_content = complete(README_SYSTEM_PROMPT, prompt)
 
     if readme_content is None:
         print("No README content generated.")
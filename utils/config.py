@@ -1,8 +1,15 @@
+import importlib.util
 import os
 import sys
+import tempfile
+import threading
+import requests
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import DefaultHttpxClient, OpenAI
 from github import Github
+from httpx import Limits
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 load_dotenv()
 
@@ -15,9 +22,83 @@ PORT = int(os.getenv("PORT", 5000))
 FALLBACK_API_KEY = os.getenv("AIPIPE_AKI_KEY", "")
 FALLBACK_BASE_URL = "https://aipipe.org/openai/v1"
 
+ASYNC_JOBS = os.getenv("ASYNC_JOBS", "false").lower() in ("1", "true", "yes")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 8))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 64))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", 3600))
+
+PAGES_POLL_MIN_INTERVAL = float(os.getenv("PAGES_POLL_MIN_INTERVAL", 5))
+PAGES_POLL_MAX_INTERVAL = float(os.getenv("PAGES_POLL_MAX_INTERVAL", 30))
+PAGES_POLL_WORKERS = int(os.getenv("PAGES_POLL_WORKERS", 4))
+PAGES_VERIFY_CONTENT = os.getenv("PAGES_VERIFY_CONTENT", "false").lower() in ("1", "true", "yes")
+
+GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+
+GITHUB_MAX_CONCURRENCY = int(os.getenv("GITHUB_MAX_CONCURRENCY", 8))
+GITHUB_WRITE_CONCURRENCY = int(os.getenv("GITHUB_WRITE_CONCURRENCY", 4))
+GITHUB_RATE_RESERVE = int(os.getenv("GITHUB_RATE_RESERVE", 50))
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", 128))
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 100 * 1024 * 1024))
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() in ("1", "true", "yes")
+LLM_PATCH_MODE = os.getenv("LLM_PATCH_MODE", "true").lower() in ("1", "true", "yes")
+
+LLM_HEDGING = os.getenv("LLM_HEDGING", "true").lower() in ("1", "true", "yes")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 0.95))
+LLM_HEDGE_INITIAL_DELAY = float(os.getenv("LLM_HEDGE_INITIAL_DELAY", 20))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", 5))
+LLM_HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", 60))
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 32))
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", 16))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 30))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 2))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() in ("1", "true", "yes")
+
+ARTIFACT_STORE_DIR = os.getenv(
+    "ARTIFACT_STORE_DIR", os.path.join(tempfile.gettempdir(), "deployed-artifacts")
+)
+ARTIFACT_STORE_MAX_BYTES = int(os.getenv("ARTIFACT_STORE_MAX_BYTES", 50 * 1024 * 1024))
+
+REPO_CACHE_TTL = float(os.getenv("REPO_CACHE_TTL", 600))
+PAGES_STATE_PATH = os.getenv(
+    "PAGES_STATE_PATH", os.path.join(tempfile.gettempdir(), "pages-state.json")
+)
+
+TASK_LOCK_DIR = os.getenv("TASK_LOCK_DIR", "")
+TASK_LOCK_TIMEOUT = float(os.getenv("TASK_LOCK_TIMEOUT", 900))
+
+IDEMPOTENCY_DB = os.getenv(
+    "IDEMPOTENCY_DB", os.path.join(tempfile.gettempdir(), "idempotency.sqlite3")
+)
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", 86400))
+IDEMPOTENCY_INFLIGHT_TTL = float(os.getenv("IDEMPOTENCY_INFLIGHT_TTL", 1800))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", 900))
+
+ATTACHMENT_CACHE_SIZE = int(os.getenv("ATTACHMENT_CACHE_SIZE", 256))
+ATTACHMENT_CACHE_MAX_BYTES = int(os.getenv("ATTACHMENT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+ATTACHMENT_CACHE_DIR = os.getenv("ATTACHMENT_CACHE_DIR", "")
+ATTACHMENT_CACHE_DISK_MAX_BYTES = int(
+    os.getenv("ATTACHMENT_CACHE_DISK_MAX_BYTES", 256 * 1024 * 1024)
+)
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 48000))
+
+EVIDENCE_QUEUE_SIZE = int(os.getenv("EVIDENCE_QUEUE_SIZE", 1000))
+EVIDENCE_QUEUE_BYTES = int(os.getenv("EVIDENCE_QUEUE_BYTES", 64 * 1024 * 1024))
+EVIDENCE_BATCH_SIZE = int(os.getenv("EVIDENCE_BATCH_SIZE", 20))
+EVIDENCE_FLUSH_INTERVAL = float(os.getenv("EVIDENCE_FLUSH_INTERVAL", 2))
+EVIDENCE_SPILL_PATH = os.getenv("EVIDENCE_SPILL_PATH", "")
+
 _openai_client = None
 _fallback_client = None
 _github_client = None
+_http_session = None
+_httpx_client = None
+_transport_lock = threading.Lock()
 
 
 def validate_config():
@@ -62,6 +143,63 @@ def load_config():
     }
 
 
+class _PooledSession(requests.Session):
+    """requests.Session that applies HTTP_TIMEOUT when a call sets no timeout."""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", HTTP_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+
+def get_http_session():
+    """
+    Process-wide keep-alive session used for raw GitHub REST calls, Pages
+    checks, the evaluation notifier and the evidence logger.
+
+    Connection errors and 502/503/504 answers to idempotent requests are
+    retried HTTP_RETRIES times; POSTs are only retried on connection errors.
+    """
+    global _http_session
+    if _http_session is None:
+        with _transport_lock:
+            if _http_session is None:
+                retry = Retry(
+                    total=HTTP_RETRIES,
+                    backoff_factor=0.5,
+                    status_forcelist=(502, 503, 504),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_HOSTS,
+                    pool_maxsize=HTTP_POOL_SIZE,
+                    max_retries=retry,
+                )
+                session = _PooledSession()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+
+def get_httpx_client():
+    """Shared connection pool for the LLM clients (HTTP/2 when enabled and h2 is installed)."""
+    global _httpx_client
+    if _httpx_client is None:
+        with _transport_lock:
+            if _httpx_client is None:
+                http2 = HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+                if HTTP2_ENABLED and not http2:
+                    print("Warning: HTTP2_ENABLED is set but the 'h2' package is missing, using HTTP/1.1")
+                _httpx_client = DefaultHttpxClient(
+                    limits=Limits(
+                        max_connections=HTTP_POOL_SIZE,
+                        max_keepalive_connections=HTTP_POOL_SIZE,
+                    ),
+                    http2=http2,
+                )
+    return _httpx_client
+
+
 def get_openai_client():
     global _openai_client
     if _openai_client is None:
@@ -70,6 +208,7 @@ def get_openai_client():
         _openai_client = OpenAI(
             api_key=OPENAI_API_KEY,
             base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+            http_client=get_httpx_client(),
         )
     return _openai_client
 
@@ -80,6 +219,7 @@ def get_fallback_client():
         _fallback_client = OpenAI(
             api_key=FALLBACK_API_KEY,
             base_url=FALLBACK_BASE_URL,
+            http_client=get_httpx_client(),
         )
     return _fallback_client
 
@@ -89,5 +229,13 @@ def get_github_client():
     if _github_client is None:
         if not GITHUB_TOKEN:
             raise ValueError("GITHUB_TOKEN not set in environment")
-        _github_client = Github(GITHUB_TOKEN)
+        # Imported here because the scheduler itself depends on this module
+        from .github_scheduler import install_pygithub_scheduler
+
+        install_pygithub_scheduler()
+        _github_client = Github(
+            GITHUB_TOKEN,
+            timeout=int(HTTP_TIMEOUT),
+            pool_size=HTTP_POOL_SIZE,
+        )
     return _github_client
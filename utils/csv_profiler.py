@@ -0,0 +1,250 @@
+"""
+Streaming profiler for large CSV/TSV attachments.
+Rows are parsed with the csv module straight from the decoded buffer in chunks,
+so memory stays bounded by the chunk size. Each column gets an inferred type,
+null count, cardinality, top values and numeric min/max/mean; the chunk
+statistics are vectorized with NumPy when it is installed.
+"""
+import csv
+import io
+import math
+from collections import Counter
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+try:
+    import numpy as np
+except ImportError:  # optional, the pure-Python path gives the same results
+    np = None
+
+CHUNK_ROWS = 50000
+SAMPLE_ROWS = 5
+TOP_VALUES = 5
+MAX_TRACKED_VALUES = 10000
+MAX_CELL_CHARS = 80
+NULL_VALUES = {"", "na", "n/a", "nan", "null", "none", "-"}
+# Spellings matched by set intersection instead of normalizing every cell
+NULL_SPELLINGS = frozenset(
+    variant
+    for value in NULL_VALUES
+    for variant in (value, value.upper(), value.capitalize(), value.title())
+)
+BOOLEAN_VALUES = {"true", "false", "yes", "no"}
+SNIFF_BYTES = 64 * 1024
+
+csv.field_size_limit(16 * 1024 * 1024)
+
+
+class _BufferReader(io.RawIOBase):
+    """Read-only file object over a memoryview, so decoding never copies it whole."""
+
+    def __init__(self, data: memoryview):
+        self._data = data
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), len(self._data) - self._pos)
+        buffer[:size] = self._data[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+
+class ColumnProfile:
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.nulls = 0
+        self.numeric = 0
+        self.integral = True
+        self.minimum: Optional[float] = None
+        self.maximum: Optional[float] = None
+        self.total = 0.0
+        self.values: Counter = Counter()
+        self.values_truncated = False
+
+    def add(self, values: List[str]) -> None:
+        self.count += len(values)
+        # Everything here runs in C per cell; Python code only sees distinct null spellings
+        self.values.update(values)
+        null_keys = NULL_SPELLINGS.intersection(self.values)
+        nulls = sum(self.values.pop(v) for v in null_keys)
+        self.nulls += nulls
+        if nulls == len(values):
+            return
+
+        if len(self.values) > MAX_TRACKED_VALUES:
+            # Keep the heavy hitters; cardinality becomes a lower bound
+            self.values = Counter(dict(self.values.most_common(MAX_TRACKED_VALUES // 2)))
+            self.values_truncated = True
+
+        if self.numeric >= 0:
+            present = [v for v in values if v not in null_keys] if nulls else values
+            self._add_numeric(present)
+
+    def _add_numeric(self, present: List[str]) -> None:
+        """Numeric stats are only kept while every non-null value so far parsed as a number."""
+        if np is not None:
+            try:
+                numbers = np.asarray(present, dtype=np.float64)
+            except ValueError:
+                self.numeric = -1
+                return
+            if not np.all(np.isfinite(numbers)):
+                self.numeric = -1
+                return
+            low, high, total = float(numbers.min()), float(numbers.max()), float(numbers.sum())
+            integral = bool(np.all(np.mod(numbers, 1) == 0))
+        else:
+            try:
+                numbers = list(map(float, present))
+            except ValueError:
+                self.numeric = -1
+                return
+            if not all(map(math.isfinite, numbers)):
+                self.numeric = -1
+                return
+            low, high, total = min(numbers), max(numbers), math.fsum(numbers)
+            integral = all(map(float.is_integer, numbers))
+
+        self.numeric += len(present)
+        self.total += total
+        self.integral = self.integral and integral
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+    @property
+    def inferred_type(self) -> str:
+        present = self.count - self.nulls
+        if present == 0:
+            return "empty"
+        if self.numeric == present:
+            return "integer" if self.integral else "float"
+        if not self.values_truncated and all(
+            v.strip().lower() in BOOLEAN_VALUES for v in self.values
+        ):
+            return "boolean"
+        return "string"
+
+    def to_dict(self) -> Dict[str, Any]:
+        info: Dict[str, Any] = {
+            "name": self.name,
+            "type": self.inferred_type,
+            "nulls": self.nulls,
+            "distinct": len(self.values),
+            "distinct_is_lower_bound": self.values_truncated,
+        }
+        if info["type"] in ("integer", "float"):
+            info["min"] = self.minimum
+            info["max"] = self.maximum
+            info["mean"] = self.total / self.numeric if self.numeric else None
+        if info["type"] != "empty":
+            info["top_values"] = [
+                [_clip(value), count]
+                for value, count in self.values.most_common(TOP_VALUES)
+            ]
+        return info
+
+
+def _clip(value: str) -> str:
+    return value if len(value) <= MAX_CELL_CHARS else value[:MAX_CELL_CHARS] + "..."
+
+
+def _detect_dialect(head: str, filename: str) -> tuple:
+    """Return (delimiter, has_header) guessed from the start of the file."""
+    if filename.lower().endswith(".tsv"):
+        delimiter = "\t"
+    else:
+        try:
+            delimiter = csv.Sniffer().sniff(head, delimiters=",;\t|").delimiter
+        except csv.Error:
+            delimiter = ","
+    try:
+        has_header = csv.Sniffer().has_header(head)
+    except csv.Error:
+        has_header = True
+    return delimiter, has_header
+
+
+def _chunks(rows: Iterable[List[str]], size: int) -> Iterable[List[List[str]]]:
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _profile_stream(text_stream, filename: str, head: str) -> Dict[str, Any]:
+    delimiter, has_header = _detect_dialect(head, filename)
+    reader = csv.reader(text_stream, delimiter=delimiter)
+
+    header: Optional[List[str]] = None
+    columns: List[ColumnProfile] = []
+    sample: List[List[str]] = []
+    rows = 0
+    ragged = 0
+
+    for chunk in _chunks(reader, CHUNK_ROWS):
+        chunk = list(filter(None, chunk))
+        if header is None and chunk:
+            if has_header:
+                header = chunk.pop(0)
+            else:
+                header = [f"column_{i + 1}" for i in range(len(chunk[0]))]
+            columns = [ColumnProfile(name.strip() or f"column_{i + 1}") for i, name in enumerate(header)]
+        if not chunk:
+            continue
+
+        width = len(columns)
+        if set(map(len, chunk)) != {width}:
+            ragged += sum(1 for row in chunk if len(row) != width)
+            chunk = [(row + [""] * width)[:width] for row in chunk]
+
+        if len(sample) < SAMPLE_ROWS:
+            sample.extend([_clip(cell) for cell in row] for row in chunk[:SAMPLE_ROWS - len(sample)])
+
+        rows += len(chunk)
+        for column, values in zip(columns, zip(*chunk)):
+            column.add(list(values))
+
+    return {
+        "delimiter": delimiter,
+        "has_header": has_header,
+        "rows": rows,
+        "ragged_rows": ragged,
+        "header": [_clip(name) for name in header or []],
+        "columns": [column.to_dict() for column in columns],
+        "sample": sample,
+    }
+
+
+def profile_csv(data: Union[bytes, memoryview], filename: str = "data.csv") -> Dict[str, Any]:
+    """
+    Profile CSV/TSV content without materializing it as one string.
+
+    Returns:
+        Dict with delimiter, has_header, rows, ragged_rows, header, columns
+        (per-column type and statistics) and sample (first data rows)
+    """
+    data = memoryview(data)
+    head_bytes = bytes(data[:SNIFF_BYTES])
+    for encoding in ("utf-8-sig", "latin-1"):
+        head = head_bytes.decode(encoding, errors="ignore")
+        # Sniff on whole lines only
+        if len(data) > SNIFF_BYTES and "\n" in head:
+            head = head[:head.rindex("\n")]
+        stream = io.TextIOWrapper(
+            io.BufferedReader(_BufferReader(data)), encoding=encoding, newline=""
+        )
+        try:
+            profile = _profile_stream(stream, filename, head)
+            profile["encoding"] = encoding
+            return profile
+        except UnicodeDecodeError:
+            continue
+        finally:
+            stream.detach()
+    raise ValueError("Could not decode CSV content")
@@ -0,0 +1,153 @@
+"""
+Deployment writer that publishes a set of files as a single commit using the
+GitHub Git Data API (blobs → tree → commit → ref update).
+Replaces one Contents API round trip and one commit per file. Files whose git
+blob SHA is already in the branch tree are not uploaded again, and when nothing
+changed no commit is made at all.
+"""
+import base64
+from typing import Dict, Optional, Union
+from github import GithubException, InputGitTreeElement
+
+from .artifact_store import git_blob_sha
+
+
+class DeploymentWriter:
+    def __init__(self, repo, branch: str = "main"):
+        """
+        Args:
+            repo: PyGithub repository object
+            branch: Branch whose ref is advanced by the commit
+        """
+        self.repo = repo
+        self.branch = branch
+        self._files: Dict[str, Union[str, bytes]] = {}
+        self._blob_shas: Dict[str, str] = {}
+        self._uploaded: set = set()
+        # False after commit() found every staged file already on the branch
+        self.changed: Optional[bool] = None
+
+    def add_file(self, path: str, content: Union[str, bytes]) -> None:
+        """Stage a file for the next commit. Later calls for the same path win."""
+        self._files[path] = content
+        self._blob_shas.pop(path, None)
+        self._uploaded.discard(path)
+
+    def has_changes(self) -> bool:
+        return bool(self._files)
+
+    def _base_blobs(self, tree) -> Dict[str, str]:
+        """Map path → blob SHA for the files in tree (empty if it cannot be read)."""
+        try:
+            entries = self.repo.get_git_tree(tree.sha, recursive=True).tree
+        except GithubException as e:
+            print(f"Warning: Could not list {self.branch} tree, uploading every file: {str(e)}")
+            return {}
+        return {entry.path: entry.sha for entry in entries if entry.type == "blob"}
+
+    def _tree_elements(self, base_blobs: Dict[str, str]) -> list:
+        elements = []
+        known_shas = set(base_blobs.values())
+        for path, content in self._files.items():
+            if isinstance(content, str):
+                if base_blobs.get(path) == git_blob_sha(content):
+                    continue
+                elements.append(
+                    InputGitTreeElement(
+                        path=path, mode="100644", type="blob", content=content
+                    )
+                )
+                continue
+
+            sha = self._blob_shas.setdefault(path, git_blob_sha(content))
+            if base_blobs.get(path) == sha:
+                # Unchanged, the base tree already carries it
+                continue
+            if sha in known_shas:
+                # Same content exists under another path, reference the existing blob
+                elements.append(
+                    InputGitTreeElement(path=path, mode="100644", type="blob", sha=sha)
+                )
+                continue
+
+            # Binary content cannot be sent inline in a tree, upload it as a blob once
+            if path not in self._uploaded:
+                blob = self.repo.create_git_blob(
+                    base64.b64encode(content).decode("ascii"), "base64"
+                )
+                self._blob_shas[path] = blob.sha
+                self._uploaded.add(path)
+            elements.append(
+                InputGitTreeElement(
+                    path=path, mode="100644", type="blob", sha=self._blob_shas[path]
+                )
+            )
+        return elements
+
+    def _bootstrap_empty_repo(self) -> None:
+        """
+        The Git Data API refuses to work on a repository without commits, so
+        create the first staged text file through the Contents API to get a branch.
+        """
+        path, content = next(
+            ((p, c) for p, c in self._files.items() if isinstance(c, str)),
+            ("README.md", f"# {self.repo.name}\n"),
+        )
+        print(f"Repository is empty, initializing {self.branch} with {path}...")
+        try:
+            self.repo.create_file(
+                path=path, message=f"Add {path}", content=content, branch=self.branch
+            )
+        except GithubException as e:
+            if e.status != 422:
+                raise
+
+    def commit(self, message: str, max_retries: int = 3) -> Optional[str]:
+        """
+        Create one commit containing every staged file and move the branch to it.
+
+        Returns:
+            SHA of the new commit (the current head if every staged file is
+            already there unchanged), or None if nothing was staged
+        """
+        if not self._files:
+            return None
+
+        for attempt in range(max_retries):
+            try:
+                ref = self.repo.get_git_ref(f"heads/{self.branch}")
+            except GithubException as e:
+                if e.status in (404, 409) and attempt < max_retries - 1:
+                    self._bootstrap_empty_repo()
+                    continue
+                raise
+
+            head = self.repo.get_git_commit(ref.object.sha)
+            elements = self._tree_elements(self._base_blobs(head.tree))
+            if not elements:
+                print(f"All {len(self._files)} file(s) unchanged on {self.branch}, skipping commit")
+                self.changed = False
+                return head.sha
+            tree = self.repo.create_git_tree(elements, base_tree=head.tree)
+            new_commit = self.repo.create_git_commit(message, tree, [head])
+
+            try:
+                ref.edit(new_commit.sha)
+            except GithubException as e:
+                # 422 means the branch moved underneath us (not a fast-forward)
+                if e.status == 422 and attempt < max_retries - 1:
+                    print(
+                        f"Branch {self.branch} moved during commit, rebasing (attempt {attempt + 2}/{max_retries})..."
+                    )
+                    continue
+                raise
+
+            print(
+                f"Committed {len(elements)} changed file(s) to {self.branch} in {new_commit.sha[:7]}"
+            )
+            self.changed = True
+            return new_commit.sha
+
+        raise RuntimeError(
+            f"Failed to commit to {self.branch} after {max_retries} attempts"
+        )
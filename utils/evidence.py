@@ -1,32 +1,260 @@
+import atexit
+import json
+import os
+import queue
 import threading
-import requests
 import time
 
+from .config import (
+    get_http_session,
+    EVIDENCE_QUEUE_SIZE,
+    EVIDENCE_QUEUE_BYTES,
+    EVIDENCE_BATCH_SIZE,
+    EVIDENCE_FLUSH_INTERVAL,
+    EVIDENCE_SPILL_PATH,
+)
+
 log_url = "https://store-evidence.vercel.app/api/store"
 
-def send_evidence_log(data, response_data, req_ip=None, req_url=None):
-    def _send_log():
+_STOP = object()
+
+# Delivery attempts per record before it is dropped, and the cap on the
+# exponential delay between replays of the spill file
+MAX_ATTEMPTS = 5
+MAX_REPLAY_DELAY = 300
+# Seconds to wait for the log endpoint per record
+POST_TIMEOUT = 5
+
+
+class EvidenceShipper:
+    """
+    Single background thread that ships evidence records from a bounded queue.
+    Records are taken off the queue in groups of up to EVIDENCE_BATCH_SIZE, or
+    whatever arrived within EVIDENCE_FLUSH_INTERVAL seconds, and posted one by
+    one (the log endpoint stores a single record per request). If the endpoint
+    does not answer, the rest of the group is spilled instead of waiting on it. The queue is bounded both by record
+    count and by the serialized size of the records it holds (EVIDENCE_QUEUE_BYTES),
+    since a record carries the request's attachments in full. When the queue
+    is full or a record cannot be delivered it is appended to EVIDENCE_SPILL_PATH (if set) and
+    replayed later with exponential backoff, otherwise it is dropped. A record
+    is given up after MAX_ATTEMPTS failed deliveries.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = EVIDENCE_QUEUE_SIZE,
+        max_bytes: int = EVIDENCE_QUEUE_BYTES,
+        batch_size: int = EVIDENCE_BATCH_SIZE,
+        flush_interval: float = EVIDENCE_FLUSH_INTERVAL,
+        spill_path: str = EVIDENCE_SPILL_PATH,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self.spilled = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._bytes_lock = threading.Lock()
+        self._queued_bytes = 0
+        self._replay_delay = 0.0
+        self._replay_after = 0.0
+        self._thread = threading.Thread(
+            target=self._run, name="evidence-shipper", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, payload: dict) -> bool:
+        """Queue a record without blocking. Returns False if it had to be spilled or dropped."""
+        if self._enqueue(payload, len(json.dumps(payload, default=str))):
+            return True
+        self._spill([payload], "queue full")
+        return False
+
+    def _enqueue(self, record: dict, size: int) -> bool:
+        """
+        Queue a record of size serialized bytes if both limits allow it. A
+        record larger than max_bytes is still accepted by an empty queue.
+        """
+        with self._bytes_lock:
+            if self._queued_bytes and self._queued_bytes + size > self.max_bytes:
+                return False
+            try:
+                self._queue.put_nowait((record, size))
+            except queue.Full:
+                return False
+            self._queued_bytes += size
+            return True
+
+    def _dequeue(self, timeout: float):
+        item = self._queue.get(timeout=timeout)
+        if item is _STOP:
+            return item
+        record, size = item
+        with self._bytes_lock:
+            self._queued_bytes -= size
+        return record
+
+    def flush(self, timeout: float = 10) -> None:
+        """Ship everything queued so far and stop the shipper thread."""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            batch, stop = self._next_batch()
+            if batch:
+                self._ship(batch)
+            if stop:
+                return
+            if not batch:
+                self._replay_spill()
+
+    def _next_batch(self):
+        try:
+            first = self._dequeue(self.flush_interval)
+        except queue.Empty:
+            return [], False
+        if first is _STOP:
+            return [], True
+
+        batch = [first]
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                item = self._dequeue(remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _ship(self, batch: list) -> None:
+        http = get_http_session()
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": "curl/8.0.0",
+        }
+        failed = []
+        unsent = []
+        for index, payload in enumerate(batch):
+            body = {k: v for k, v in payload.items() if k != "_attempts"}
+            try:
+                response = http.post(log_url, json=body, headers=headers, timeout=POST_TIMEOUT)
+                print(f"Evidence log status: {response.status_code}")
+                if response.status_code != 201:
+                    print(f"Error response: {response.text}")
+                    if response.status_code >= 500:
+                        failed.append(payload)
+            except Exception as e:
+                print(f"Error logging evidence: {e}")
+                failed.append(payload)
+                # The endpoint is down or slow, don't spend a timeout on every record
+                unsent = batch[index + 1:]
+                break
+        if not failed:
+            self._replay_delay = 0.0
+            self._replay_after = 0.0
+            return
+
+        self._replay_delay = min(
+            MAX_REPLAY_DELAY, max(self.flush_interval, self._replay_delay * 2)
+        )
+        self._replay_after = time.time() + self._replay_delay
+        retry = []
+        for payload in failed:
+            payload = {**payload, "_attempts": payload.get("_attempts", 0) + 1}
+            if payload["_attempts"] >= MAX_ATTEMPTS:
+                self.dropped += 1
+                print(f"Dropped evidence record after {MAX_ATTEMPTS} failed deliveries")
+            else:
+                retry.append(payload)
+        if retry or unsent:
+            self._spill(retry + unsent, f"delivery failed, retrying in {self._replay_delay:.0f}s")
+
+    def _spill(self, records: list, reason: str) -> None:
+        if not self.spill_path:
+            self.dropped += len(records)
+            print(f"Dropped {len(records)} evidence record(s): {reason}")
+            return
         try:
-            payload = {
-                **data,
-                "req_ip": req_ip or "N/A",
-                "req_url": req_url or "N/A",
-                "response_json": response_data,
-            }
-            headers = {
-                "Content-Type": "application/json",
-                "User-Agent": "curl/8.0.0",
-            }
-            response = requests.post(log_url, json=payload, headers=headers, timeout=30)
-            print(f"Evidence log status: {response.status_code}")
-            if response.status_code != 201:
-                print(f"Error response: {response.text}")
-        except Exception as e:
-            print(f"Error logging evidence: {e}")
-    
-    thread = threading.Thread(target=_send_log)
-    thread.start()
-    return thread 
+            with self._spill_lock:
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    for record in records:
+                        f.write(json.dumps(record, default=str) + "\n")
+            self.spilled += len(records)
+            print(f"Spilled {len(records)} evidence record(s) to disk: {reason}")
+        except OSError as e:
+            self.dropped += len(records)
+            print(f"Dropped {len(records)} evidence record(s), spill failed: {e}")
+
+    def _replay_spill(self) -> None:
+        """Move spilled records back into the queue while it has room."""
+        if not self.spill_path or time.time() < self._replay_after:
+            return
+        if not os.path.exists(self.spill_path):
+            return
+        with self._spill_lock:
+            try:
+                with open(self.spill_path, "r", encoding="utf-8") as f:
+                    lines = f.readlines()
+                os.remove(self.spill_path)
+            except OSError:
+                return
+
+        leftover = []
+        for index, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not self._enqueue(record, len(line)):
+                leftover = lines[index:]
+                break
+
+        if leftover:
+            with self._spill_lock:
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    f.writelines(leftover)
+
+
+_shipper = None
+_shipper_lock = threading.Lock()
+
+
+def get_evidence_shipper() -> EvidenceShipper:
+    global _shipper
+    if _shipper is None:
+        with _shipper_lock:
+            if _shipper is None:
+                _shipper = EvidenceShipper()
+                atexit.register(_shipper.flush)
+    return _shipper
+
+
+def send_evidence_log(data, response_data, req_ip=None, req_url=None):
+    payload = {
+        **data,
+        "req_ip": req_ip or "N/A",
+        "req_url": req_url or "N/A",
+        "response_json": response_data,
+    }
+    return get_evidence_shipper().submit(payload)
+
+
+def flush_evidence_logs(timeout: float = 10) -> None:
+    get_evidence_shipper().flush(timeout)
+
 
 def mock_test_evidence_logging():
     test_data = {
@@ -55,7 +283,7 @@ def mock_test_evidence_logging():
 
 if __name__ == "__main__":
     print("Testing evidence logging...")
-    thread = mock_test_evidence_logging()
-    print("Request sent, waiting for response...")
-    thread.join(timeout=10) 
+    mock_test_evidence_logging()
+    print("Request queued, waiting for response...")
+    flush_evidence_logs(timeout=10)
     print("Done.")
@@ -1,12 +1,139 @@
 import base64
+import binascii
+import csv
+import hashlib
+import io
 import mimetypes
-from typing import Dict, Optional, Any
+import threading
+from typing import Dict, List, Optional, Any, Tuple, Union
+from urllib.parse import unquote_to_bytes
 import json
 
+from .cache import DiskCache, LRUCache, TieredCache
+from .csv_profiler import profile_csv
+from .config import (
+    ATTACHMENT_CACHE_SIZE,
+    ATTACHMENT_CACHE_MAX_BYTES,
+    ATTACHMENT_CACHE_DIR,
+    ATTACHMENT_CACHE_DISK_MAX_BYTES,
+)
+
 
 MAX_FULL_CONTENT_CHARS = 20000
 MAX_PREVIEW_LINES = 10
 
+# Base64 characters decoded per step; a multiple of 4 so chunks stay aligned
+DECODE_CHUNK_CHARS = 1 << 20
+
+
+class Attachment:
+    """
+    A single attachment, whatever form it arrived in (data URI, bare base64,
+    raw bytes). The data URI header is parsed once, the decoded size is derived
+    from the base64 length, and the payload is decoded at most once, on first
+    access to data, into one buffer.
+    """
+
+    __slots__ = ("name", "url", "mime_type", "is_base64", "_start", "_data")
+
+    def __init__(
+        self,
+        name: str,
+        url: str = "",
+        mime_type: Optional[str] = None,
+        data: Optional[Union[bytes, memoryview]] = None,
+    ):
+        """
+        Args:
+            name: File name used for type detection
+            url: Data URI, remote URL or bare base64 payload
+            mime_type: Overrides the type from the data URI header or file name
+            data: Raw content, when the attachment did not arrive encoded
+        """
+        self.name = name
+        self.url = url
+        self.is_base64 = True
+        self._start = 0
+        self._data = memoryview(data) if data is not None else None
+
+        header_mime = None
+        if url.startswith("data:"):
+            comma = url.find(",")
+            if comma == -1:
+                comma = len(url)
+            params = url[5:comma].split(";")
+            header_mime = params[0] or None
+            self.is_base64 = "base64" in params[1:]
+            self._start = comma + 1
+        self.mime_type = mime_type or header_mime or mimetypes.guess_type(name)[0]
+
+    @property
+    def is_data_uri(self) -> bool:
+        """True for content carried inline (data URI, bare base64 or raw bytes)."""
+        return self._data is not None or (bool(self.url) and not self.is_remote)
+
+    @property
+    def is_remote(self) -> bool:
+        return self.url.startswith(("http://", "https://"))
+
+    @property
+    def size_bytes(self) -> int:
+        """Decoded size, computed from the base64 length (whitespace excluded) without decoding."""
+        if self._data is not None:
+            return len(self._data)
+        if not self.is_data_uri:
+            return 0
+        if not self.is_base64:
+            return len(self.data)
+        end = len(self.url)
+        while end > self._start and self.url[end - 1] in "\r\n\t ":
+            end -= 1
+        padding = 0
+        while end > self._start and padding < 2 and self.url[end - 1] == "=":
+            end -= 1
+            padding += 1
+        # Line breaks inside the payload are skipped by the decoder too
+        whitespace = sum(self.url.count(ch, self._start, end) for ch in "\r\n\t ")
+        return (end - self._start - whitespace) * 3 // 4
+
+    @property
+    def data(self) -> memoryview:
+        if self._data is None:
+            self._data = self._decode()
+        return self._data
+
+    def _decode(self) -> memoryview:
+        if self.is_remote:
+            return memoryview(b"")
+        if not self.is_base64:
+            return memoryview(unquote_to_bytes(self.url[self._start:]))
+
+        expected = self.size_bytes
+        buffer = bytearray(expected)
+        view = memoryview(buffer)
+        pos = 0
+        try:
+            for offset in range(self._start, len(self.url), DECODE_CHUNK_CHARS):
+                chunk = self.url[offset:offset + DECODE_CHUNK_CHARS]
+                if len(chunk) % 4:
+                    chunk += "=" * (4 - len(chunk) % 4)
+                decoded = binascii.a2b_base64(chunk)
+                view[pos:pos + len(decoded)] = decoded
+                pos += len(decoded)
+        except (binascii.Error, ValueError):
+            pos = -1
+
+        if pos != expected:
+            # Embedded whitespace or otherwise irregular base64: decode in one go
+            return memoryview(decode_base64_content(self.url))
+        return view
+
+
+def _as_attachment(value: Union["Attachment", bytes], filename: str) -> "Attachment":
+    if isinstance(value, Attachment):
+        return value
+    return Attachment(filename, data=value)
+
 
 def decode_base64_content(content: str) -> bytes:
     try:
@@ -31,13 +158,14 @@ def decode_to_text(data: bytes, encodings: list = None) -> str:
     if encodings is None:
         encodings = ["utf-8", "utf-8-sig", "latin-1", "cp1252", "iso-8859-1", "ascii"]
     
+    # str() decodes bytes and memoryviews alike without copying them first
     for encoding in encodings:
         try:
-            return data.decode(encoding)
+            return str(data, encoding)
         except Exception:
             continue
     
-    return data.decode("utf-8", errors="ignore")
+    return str(data, "utf-8", errors="ignore")
 
 
 def extract_mime_type(data_uri: str) -> str:
@@ -109,7 +237,10 @@ def is_document_file(filename: str) -> bool:
     return any(filename.lower().endswith(ext) for ext in document_extensions)
 
 
-def process_text_content(data: bytes, filename: str) -> Dict[str, Any]:
+def process_text_content(attachment: Union[Attachment, bytes], filename: Optional[str] = None) -> Dict[str, Any]:
+    attachment = _as_attachment(attachment, filename)
+    filename = filename or attachment.name
+    data = attachment.data
     text_content = decode_to_text(data)
     lines = text_content.splitlines()
     total_lines = len(lines)
@@ -141,28 +272,51 @@ def process_text_content(data: bytes, filename: str) -> Dict[str, Any]:
     }
 
 
-def process_markdown_content(data: bytes, filename: str) -> Dict[str, Any]:
-    text_info = process_text_content(data, filename)
+def process_markdown_content(attachment: Union[Attachment, bytes], filename: Optional[str] = None) -> Dict[str, Any]:
+    text_info = process_text_content(attachment, filename)
     text_info["type"] = "markdown"
     text_info["needs_conversion"] = True
     text_info["conversion_target"] = "HTML"
     return text_info
 
 
-def process_csv_content(data: bytes, filename: str) -> Dict[str, Any]:
+def process_csv_content(attachment: Union[Attachment, bytes], filename: Optional[str] = None) -> Dict[str, Any]:
+    attachment = _as_attachment(attachment, filename)
+    filename = filename or attachment.name
+    data = attachment.data
+
+    if len(data) > MAX_FULL_CONTENT_CHARS:
+        # Too large to send: profile it as a stream instead of decoding it whole
+        try:
+            profile = profile_csv(data, filename)
+            header_rows = [profile["header"]] if profile["has_header"] else []
+            return {
+                "type": "csv",
+                "filename": filename,
+                "total_lines": profile["rows"] + len(header_rows),
+                "preview_rows": len(profile["sample"]),
+                "rows": header_rows + profile["sample"],
+                "profile": profile,
+                "send_full": False,
+                "size_bytes": len(data),
+            }
+        except Exception as e:
+            print(f"Warning: CSV profiling failed for {filename}: {str(e)}")
+
     text_content = decode_to_text(data)
     lines = text_content.splitlines()
     content_length = len(text_content)
     
     send_full_content = content_length <= MAX_FULL_CONTENT_CHARS
     
-    rows = []
+    delimiter = "\t" if filename.lower().endswith(".tsv") else ","
     max_preview_rows = 20 if not send_full_content else len(lines)
-    
-    for i, line in enumerate(lines[:max_preview_rows]):
-        if line.strip():
-            cells = line.split(",")
-            rows.append(cells)
+    rows = []
+    for row in csv.reader(io.StringIO(text_content), delimiter=delimiter):
+        if len(rows) >= max_preview_rows:
+            break
+        if row:
+            rows.append(row)
     
     return {
         "type": "csv",
@@ -177,7 +331,10 @@ def process_csv_content(data: bytes, filename: str) -> Dict[str, Any]:
     }
 
 
-def process_json_content(data: bytes, filename: str) -> Dict[str, Any]:
+def process_json_content(attachment: Union[Attachment, bytes], filename: Optional[str] = None) -> Dict[str, Any]:
+    attachment = _as_attachment(attachment, filename)
+    filename = filename or attachment.name
+    data = attachment.data
     text_content = decode_to_text(data)
     content_length = len(text_content)
     
@@ -207,92 +364,124 @@ def process_json_content(data: bytes, filename: str) -> Dict[str, Any]:
     }
 
 
-def process_image_content(url: str, filename: str) -> Dict[str, Any]:
-    mime_type = extract_mime_type(url) if url.startswith("data:") else mimetypes.guess_type(filename)[0]
-    
-    size_estimate = 0
-    if url.startswith("data:"):
-        if "base64" in url:
-            try:
-                base64_data = url.split(",", 1)[1]
-                size_estimate = len(base64.b64decode(base64_data))
-            except Exception:
-                pass
-    
+def _embed_src(attachment: Attachment) -> str:
+    return "{{DATA_URI}}" if attachment.is_data_uri else attachment.url
+
+
+def process_image_content(attachment: Attachment) -> Dict[str, Any]:
     return {
         "type": "image",
-        "filename": filename,
-        "mime_type": mime_type or "image/unknown",
-        "url": url,
-        "is_data_uri": url.startswith("data:"),
-        "is_remote": url.startswith(("http://", "https://")),
-        "size_bytes": size_estimate,
-        "embed_tag": f'<img src="{url if not url.startswith("data:") else "{{DATA_URI}}"}" alt="{filename}">'
+        "filename": attachment.name,
+        "mime_type": attachment.mime_type or "image/unknown",
+        "url": attachment.url,
+        "is_data_uri": attachment.is_data_uri,
+        "is_remote": attachment.is_remote,
+        "size_bytes": attachment.size_bytes,
+        "embed_tag": f'<img src="{_embed_src(attachment)}" alt="{attachment.name}">'
     }
 
 
-def process_video_content(url: str, filename: str) -> Dict[str, Any]:
-    mime_type = extract_mime_type(url) if url.startswith("data:") else mimetypes.guess_type(filename)[0]
-    
+def process_video_content(attachment: Attachment) -> Dict[str, Any]:
     return {
         "type": "video",
-        "filename": filename,
-        "mime_type": mime_type or "video/unknown",
-        "url": url,
-        "is_data_uri": url.startswith("data:"),
-        "is_remote": url.startswith(("http://", "https://")),
-        "embed_tag": f'<video src="{url if not url.startswith("data:") else "{{DATA_URI}}"}" controls></video>'
+        "filename": attachment.name,
+        "mime_type": attachment.mime_type or "video/unknown",
+        "url": attachment.url,
+        "is_data_uri": attachment.is_data_uri,
+        "is_remote": attachment.is_remote,
+        "embed_tag": f'<video src="{_embed_src(attachment)}" controls></video>'
     }
 
 
-def process_audio_content(url: str, filename: str) -> Dict[str, Any]:
-    mime_type = extract_mime_type(url) if url.startswith("data:") else mimetypes.guess_type(filename)[0]
-    
+def process_audio_content(attachment: Attachment) -> Dict[str, Any]:
     return {
         "type": "audio",
-        "filename": filename,
-        "mime_type": mime_type or "audio/unknown",
-        "url": url,
-        "is_data_uri": url.startswith("data:"),
-        "is_remote": url.startswith(("http://", "https://")),
-        "embed_tag": f'<audio src="{url if not url.startswith("data:") else "{{DATA_URI}}"}" controls></audio>'
+        "filename": attachment.name,
+        "mime_type": attachment.mime_type or "audio/unknown",
+        "url": attachment.url,
+        "is_data_uri": attachment.is_data_uri,
+        "is_remote": attachment.is_remote,
+        "embed_tag": f'<audio src="{_embed_src(attachment)}" controls></audio>'
     }
 
 
-def process_document_content(url: str, filename: str) -> Dict[str, Any]:
-    mime_type = extract_mime_type(url) if url.startswith("data:") else mimetypes.guess_type(filename)[0]
-    
+def process_document_content(attachment: Attachment) -> Dict[str, Any]:
+    filename = attachment.name
     needs_conversion = filename.lower().endswith((".md", ".docx", ".doc", ".rtf", ".odt"))
     conversion_target = "HTML" if needs_conversion else None
     
     return {
         "type": "document",
         "filename": filename,
-        "mime_type": mime_type or "application/octet-stream",
-        "url": url,
-        "is_data_uri": url.startswith("data:"),
-        "is_remote": url.startswith(("http://", "https://")),
+        "mime_type": attachment.mime_type or "application/octet-stream",
+        "url": attachment.url,
+        "is_data_uri": attachment.is_data_uri,
+        "is_remote": attachment.is_remote,
         "needs_conversion": needs_conversion,
         "conversion_target": conversion_target,
-        "download_tag": f'<a href="{url if not url.startswith("data:") else "{{DATA_URI}}"}" download="{filename}">Download {filename}</a>'
+        "download_tag": f'<a href="{_embed_src(attachment)}" download="{filename}">Download {filename}</a>'
     }
 
 
+def _process_inline(attachment: Attachment) -> Dict[str, Any]:
+    """Dispatch an attachment whose content is carried inline by file type."""
+    name = attachment.name
+
+    if is_text_file(name):
+        if name.lower().endswith(".md"):
+            return process_markdown_content(attachment)
+        elif name.lower().endswith((".csv", ".tsv")):
+            return process_csv_content(attachment)
+        elif name.lower().endswith(".json"):
+            return process_json_content(attachment)
+        else:
+            return process_text_content(attachment)
+    
+    elif is_image_file(name):
+        return process_image_content(attachment)
+    
+    elif is_video_file(name):
+        return process_video_content(attachment)
+    
+    elif is_audio_file(name):
+        return process_audio_content(attachment)
+    
+    elif is_document_file(name):
+        return process_document_content(attachment)
+    
+    else:
+        try:
+            text_attempt = decode_to_text(attachment.data)
+            if len(text_attempt) > 0 and text_attempt.isprintable() or "\n" in text_attempt:
+                return process_text_content(attachment)
+        except Exception:
+            pass
+        
+        return {
+            "type": "binary",
+            "filename": name,
+            "size_bytes": attachment.size_bytes,
+            "data_uri": attachment.url
+        }
+
+
 def process_attachment(attachment: Any) -> Dict[str, Any]:
     if isinstance(attachment, str):
         if attachment.startswith("data:"):
-            mime_type = extract_mime_type(attachment)
-            filename = "attachment"
+            parsed = Attachment("attachment", attachment)
+            mime_type = parsed.mime_type or "application/octet-stream"
             
             if "image" in mime_type:
-                return process_image_content(attachment, "image")
+                parsed.name = "image"
+                return process_image_content(parsed)
             elif "video" in mime_type:
-                return process_video_content(attachment, "video")
+                parsed.name = "video"
+                return process_video_content(parsed)
             elif "audio" in mime_type:
-                return process_audio_content(attachment, "audio")
+                parsed.name = "audio"
+                return process_audio_content(parsed)
             else:
-                decoded = decode_base64_content(attachment)
-                return process_text_content(decoded, filename)
+                return process_text_content(parsed)
         
         elif attachment.startswith(("http://", "https://")):
             return {
@@ -317,77 +506,29 @@ def process_attachment(attachment: Any) -> Dict[str, Any]:
     if not url and "path" in attachment:
         try:
             with open(attachment["path"], "rb") as f:
-                file_data = f.read()
-            
-            if is_text_file(name):
-                return process_text_content(file_data, name)
-            else:
-                encoded = base64.b64encode(file_data).decode("ascii")
-                mime = mimetypes.guess_type(name)[0] or "application/octet-stream"
-                url = f"data:{mime};base64,{encoded}"
-        except Exception:
+                return _process_inline(Attachment(name, data=f.read()))
+        except OSError:
             return {"type": "error", "filename": name, "error": "Could not read file"}
     
     if not url:
         return {"type": "empty", "filename": name}
     
-    if isinstance(url, bytes):
-        if is_text_file(name):
-            return process_text_content(url, name)
-        else:
-            encoded = base64.b64encode(url).decode("ascii")
-            mime = mimetypes.guess_type(name)[0] or "application/octet-stream"
-            url = f"data:{mime};base64,{encoded}"
+    if isinstance(url, (bytes, bytearray)):
+        return _process_inline(Attachment(name, data=url))
     
     if url.startswith("data:"):
-        decoded_data = decode_base64_content(url)
-        
-        if is_text_file(name):
-            if name.lower().endswith(".md"):
-                return process_markdown_content(decoded_data, name)
-            elif name.lower().endswith((".csv", ".tsv")):
-                return process_csv_content(decoded_data, name)
-            elif name.lower().endswith(".json"):
-                return process_json_content(decoded_data, name)
-            else:
-                return process_text_content(decoded_data, name)
-        
-        elif is_image_file(name):
-            return process_image_content(url, name)
-        
-        elif is_video_file(name):
-            return process_video_content(url, name)
-        
-        elif is_audio_file(name):
-            return process_audio_content(url, name)
-        
-        elif is_document_file(name):
-            return process_document_content(url, name)
-        
-        else:
-            try:
-                text_attempt = decode_to_text(decoded_data)
-                if len(text_attempt) > 0 and text_attempt.isprintable() or "\n" in text_attempt:
-                    return process_text_content(decoded_data, name)
-            except Exception:
-                pass
-            
-            return {
-                "type": "binary",
-                "filename": name,
-                "size_bytes": len(decoded_data),
-                "data_uri": url
-            }
+        return _process_inline(Attachment(name, url))
     
     elif url.startswith(("http://", "https://")):
+        remote = Attachment(name, url)
         if is_image_file(name):
-            return process_image_content(url, name)
+            return process_image_content(remote)
         elif is_video_file(name):
-            return process_video_content(url, name)
+            return process_video_content(remote)
         elif is_audio_file(name):
-            return process_audio_content(url, name)
+            return process_audio_content(remote)
         elif is_document_file(name):
-            return process_document_content(url, name)
+            return process_document_content(remote)
         else:
             return {
                 "type": "remote_file",
@@ -398,25 +539,22 @@ def process_attachment(attachment: Any) -> Dict[str, Any]:
     else:
         if len(url) > 1000:
             try:
-                decoded_data = decode_base64_content(url)
+                # Bare base64 payload without a data URI header
+                inline = Attachment(name, url)
                 if is_text_file(name):
-                    return process_text_content(decoded_data, name)
-                else:
-                    mime = mimetypes.guess_type(name)[0] or "application/octet-stream"
-                    data_uri = f"data:{mime};base64,{url}"
-                    
-                    if is_image_file(name):
-                        return process_image_content(data_uri, name)
-                    elif is_video_file(name):
-                        return process_video_content(data_uri, name)
-                    elif is_audio_file(name):
-                        return process_audio_content(data_uri, name)
-                    
-                    return {
-                        "type": "binary",
-                        "filename": name,
-                        "data_uri": data_uri
-                    }
+                    return process_text_content(inline)
+                elif is_image_file(name):
+                    return process_image_content(inline)
+                elif is_video_file(name):
+                    return process_video_content(inline)
+                elif is_audio_file(name):
+                    return process_audio_content(inline)
+                
+                return {
+                    "type": "binary",
+                    "filename": name,
+                    "data_uri": f"data:{inline.mime_type or 'application/octet-stream'};base64,{url}"
+                }
             except Exception:
                 pass
         
@@ -427,6 +565,47 @@ def process_attachment(attachment: Any) -> Dict[str, Any]:
         }
 
 
+def _format_number(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return f"{value:.6g}"
+
+
+def _format_csv_profile(profile: Dict[str, Any]) -> str:
+    delimiter = "TAB" if profile["delimiter"] == "\t" else profile["delimiter"]
+    result = f"Data rows: {profile['rows']}\n"
+    result += f"Columns: {len(profile['columns'])} (delimiter '{delimiter}', header {'yes' if profile['has_header'] else 'no'})\n"
+    if profile.get("ragged_rows"):
+        result += f"Rows with a different column count: {profile['ragged_rows']}\n"
+
+    result += "\n=== SCHEMA ===\n"
+    for column in profile["columns"]:
+        distinct = f"{column['distinct']}{'+' if column['distinct_is_lower_bound'] else ''}"
+        line = f"- {column['name']}: {column['type']}, nulls {column['nulls']}, distinct {distinct}"
+        if column["type"] in ("integer", "float"):
+            line += (
+                f", min {_format_number(column['min'])}, max {_format_number(column['max'])}"
+                f", mean {_format_number(column['mean'])}"
+            )
+        else:
+            top = column.get("top_values") or []
+            if top:
+                line += ", top: " + ", ".join(f'"{value}" ({count})' for value, count in top)
+        result += line + "\n"
+
+    sample = io.StringIO()
+    writer = csv.writer(sample, delimiter=profile["delimiter"], lineterminator="\n")
+    if profile["has_header"]:
+        writer.writerow(profile["header"])
+    writer.writerows(profile["sample"])
+    result += "\n=== SAMPLE ROWS ===\n"
+    result += sample.getvalue()
+    result += "=== END SAMPLE ===\n"
+    return result
+
+
 def format_attachment_info(processed: Dict[str, Any]) -> str:
     info_type = processed.get("type", "unknown")
     filename = processed.get("filename", "unknown")
@@ -464,13 +643,20 @@ def format_attachment_info(processed: Dict[str, Any]) -> str:
     
     elif info_type == "csv":
         result += f"Total rows: {processed.get('total_lines', 0)}\n"
-        result += f"Characters: {processed.get('char_count', 0)}\n"
         
-        if processed.get('send_full'):
+        if processed.get('profile'):
+            result += f"Size: {processed.get('size_bytes', 0)} bytes\n"
+            result += _format_csv_profile(processed['profile'])
+        elif processed.get('send_full'):
+            result += f"Characters: {processed.get('char_count', 0)}\n"
             result += "\n=== FULL CSV CONTENT ===\n"
             result += processed.get('full_content', '')
             result += "\n=== END CSV ===\n"
         else:
+            if "char_count" in processed:
+                result += f"Characters: {processed['char_count']}\n"
+            else:
+                result += f"Size: {processed.get('size_bytes', 0)} bytes\n"
             result += f"\nPreview (first {processed.get('preview_rows', 0)} rows):\n"
             for i, row in enumerate(processed.get('rows', [])[:10], 1):
                 result += f"{i}. {', '.join(str(cell) for cell in row)}\n"
@@ -485,7 +671,7 @@ def format_attachment_info(processed: Dict[str, Any]) -> str:
                 result += f"{line}\n"
             result += "=== END JSON ===\n"
         else:
-            result += "\nPreview (first 20 lines):\n"
+            result += f"\nPreview (first {len(processed.get('preview', []))} lines):\n"
             for line in processed.get('preview', []):
                 result += f"{line}\n"
     
@@ -521,6 +707,160 @@ def format_attachment_info(processed: Dict[str, Any]) -> str:
     return result
 
 
+_attachment_cache = None
+_attachment_cache_lock = threading.Lock()
+
+# Bump when the descriptor or formatted output changes shape
+SUMMARY_VERSION = 2
+
+
+def get_attachment_cache() -> TieredCache:
+    global _attachment_cache
+    if _attachment_cache is None:
+        with _attachment_cache_lock:
+            if _attachment_cache is None:
+                disk = None
+                if ATTACHMENT_CACHE_DIR:
+                    disk = DiskCache(ATTACHMENT_CACHE_DIR, ATTACHMENT_CACHE_DISK_MAX_BYTES)
+                _attachment_cache = TieredCache(
+                    LRUCache(
+                        max_entries=ATTACHMENT_CACHE_SIZE,
+                        max_bytes=ATTACHMENT_CACHE_MAX_BYTES,
+                    ),
+                    disk,
+                    sizeof=lambda summary: len(summary["formatted"])
+                    + len(summary["descriptor"].get("full_content", "")),
+                )
+    return _attachment_cache
+
+
+def _hash_text(digest, text: str) -> None:
+    # Encode piecewise so a multi-MB data URI is never copied whole
+    for offset in range(0, len(text), DECODE_CHUNK_CHARS):
+        digest.update(text[offset:offset + DECODE_CHUNK_CHARS].encode("utf-8", "surrogatepass"))
+
+
+def attachment_fingerprint(attachment: Any) -> Optional[str]:
+    """
+    Content hash identifying an attachment across requests, or None for
+    attachments that should not be cached (files read from a path).
+    """
+    digest = hashlib.sha256(f"{SUMMARY_VERSION}|{MAX_FULL_CONTENT_CHARS}|".encode("ascii"))
+    if isinstance(attachment, str):
+        _hash_text(digest, attachment)
+        return digest.hexdigest()
+    if not isinstance(attachment, dict):
+        return None
+
+    name = attachment.get("name", attachment.get("filename", "unknown"))
+    url = attachment.get("url", attachment.get("data", attachment.get("content", "")))
+    if not url:
+        return None
+    _hash_text(digest, str(name))
+    digest.update(b"\0")
+    if isinstance(url, (bytes, bytearray)):
+        digest.update(url)
+    else:
+        _hash_text(digest, str(url))
+    return digest.hexdigest()
+
+
+def _slim_descriptor(processed: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop inline payloads from a descriptor; the prompt never uses them."""
+    slim = dict(processed)
+    slim.pop("data_uri", None)
+    if slim.get("is_data_uri"):
+        slim["url"] = None
+    return slim
+
+
+def summarize_attachment(attachment: Any) -> Dict[str, Any]:
+    """
+    Processed descriptor and formatted prompt block for one attachment, cached
+    by content hash so attachments resent in later rounds are not reprocessed.
+
+    Returns:
+        Dict with "descriptor" and "formatted"
+    """
+    def compute() -> Dict[str, Any]:
+        processed = process_attachment(attachment)
+        return {
+            "descriptor": _slim_descriptor(processed),
+            "formatted": format_attachment_info(processed),
+        }
+
+    key = attachment_fingerprint(attachment)
+    if key is None:
+        return compute()
+    return get_attachment_cache().get_or_compute(key, compute)
+
+
+ATTACHMENT_DETAIL_LEVELS = ("full", "summary", "preview", "reference")
+PREVIEW_LEVEL_LINES = 3
+
+
+def _downgrade(processed: Dict[str, Any], max_lines: int) -> Dict[str, Any]:
+    """Copy of a descriptor that shows at most max_lines lines of content."""
+    reduced = dict(processed)
+    info_type = reduced.get("type")
+
+    if info_type in ("text", "markdown"):
+        if reduced.get("send_full"):
+            lines = reduced.get("full_content", "").splitlines()
+        else:
+            lines = reduced.get("preview", [])
+        preview = [line if len(line) <= 300 else line[:300] + "..." for line in lines[:max_lines]]
+        reduced.update(send_full=False, preview=preview, preview_lines=len(preview))
+
+    elif info_type == "csv":
+        rows = reduced.get("rows", [])[:max_lines]
+        reduced.update(send_full=False, rows=rows, preview_rows=len(rows))
+        if max_lines < MAX_PREVIEW_LINES:
+            reduced.pop("profile", None)
+
+    elif info_type == "json":
+        reduced.update(send_full=False, preview=reduced.get("preview", [])[:max_lines * 2])
+
+    return reduced
+
+
+def _format_reference(processed: Dict[str, Any]) -> str:
+    result = f"\n--- {processed.get('filename', 'unknown')} ---\n"
+    result += f"Type: {processed.get('type', 'unknown')}\n"
+    if processed.get("size_bytes"):
+        result += f"Size: {processed['size_bytes']} bytes\n"
+    usage = processed.get("embed_tag") or processed.get("download_tag")
+    if usage:
+        result += f"Usage: {usage}\n"
+    result += "(Content omitted to fit the prompt size limit)\n\n"
+    return result
+
+
+def attachment_detail_levels(attachment: Any, index: int = 1) -> List[Tuple[str, str]]:
+    """
+    Formatted prompt blocks for one attachment at each level of
+    ATTACHMENT_DETAIL_LEVELS, most detailed first. Levels that would not be
+    smaller than the previous one are left out.
+    """
+    try:
+        summary = summarize_attachment(attachment)
+    except Exception as e:
+        return [("full", f"\n--- Attachment {index} ---\nError processing: {str(e)[:200]}\n\n")]
+
+    descriptor = summary["descriptor"]
+    candidates = [
+        ("full", summary["formatted"]),
+        ("summary", format_attachment_info(_downgrade(descriptor, MAX_PREVIEW_LINES))),
+        ("preview", format_attachment_info(_downgrade(descriptor, PREVIEW_LEVEL_LINES))),
+        ("reference", _format_reference(descriptor)),
+    ]
+    levels = [candidates[0]]
+    for level, text in candidates[1:]:
+        if len(text) < len(levels[-1][1]):
+            levels.append((level, text))
+    return levels
+
+
 def process_all_attachments(attachments: Optional[list]) -> str:
     if not attachments:
         return ""
@@ -529,8 +869,7 @@ def process_all_attachments(attachments: Optional[list]) -> str:
     
     for i, att in enumerate(attachments, 1):
         try:
-            processed = process_attachment(att)
-            result += format_attachment_info(processed)
+            result += summarize_attachment(att)["formatted"]
         except Exception as e:
             result += f"\n--- Attachment {i} ---\n"
             result += f"Error processing: {str(e)[:200]}\n\n"
@@ -1,30 +1,93 @@
-from typing import Dict, Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 import requests
 import time
 from github import GithubException
-from .config import get_github_client, GITHUB_USERNAME, GITHUB_TOKEN
+from .config import (
+    get_github_client,
+    get_http_session,
+    GITHUB_USERNAME,
+    GITHUB_TOKEN,
+    PAGES_VERIFY_CONTENT,
+)
 from .code_generator import generate_readme as generate_readme_content
 from .asset_handler import process_html_assets
+from .deploy_writer import DeploymentWriter
+from .pages_poller import get_pages_poller
+from .artifact_store import get_artifact_store, git_blob_sha
+from .repo_cache import get_repo_cache
+from .pages_state import get_pages_state
+from .webhooks import register_webhook, webhooks_enabled
+from .github_scheduler import POLL, github_request
 from requests import RequestException
 
 
-def get_existing_code(task: str, path: str = "index.html") -> Optional[str]:
+def _read_deployed_code(task: str, path: str) -> Optional[str]:
+    """
+    Return path as we last deployed it for task if the local artifact store
+    has it and the branch has not moved since. Freshness is checked with a
+    conditional request on the branch ref; a 304 does not count against the
+    rate limit.
+    """
+    store = get_artifact_store()
+    if store is None:
+        return None
+    manifest = store.get_manifest(task)
+    if manifest is None or path not in manifest["files"]:
+        return None
+    content = store.read_file(task, path)
+    if content is None:
+        return None
+
+    hdrs = {
+        "Accept": "application/vnd.github+json",
+        "Authorization": f"Bearer {GITHUB_TOKEN}",
+        "X-GitHub-Api-Version": "2022-11-28",
+    }
+    if manifest.get("etag"):
+        hdrs["If-None-Match"] = manifest["etag"]
+
     try:
-        github_client = get_github_client()
-        user = github_client.get_user()
+        r = github_request(
+            "GET",
+            f"https://api.github.com/repos/{manifest['owner']}/{task}/git/ref/heads/main",
+            headers=hdrs,
+            timeout=10,
+        )
+    except RequestException as e:
+        print(f"Warning: Could not validate stored {path} for {task}: {str(e)}")
+        return None
+
+    if r.status_code == 304:
+        fresh = True
+    elif r.status_code == 200:
+        fresh = r.json().get("object", {}).get("sha") == manifest["commit_sha"]
+        if fresh:
+            store.update_etag(task, r.headers.get("ETag"))
+    else:
+        fresh = False
+        if r.status_code == 404:
+            store.forget(task)
+
+    if not fresh:
+        print(f"Stored {path} for {task} is out of date, fetching from GitHub...")
+        return None
+
+    decoded = content.decode("utf-8")
+    print(
+        f"Using stored {path} for {task} from commit {manifest['commit_sha'][:7]} (size: {len(decoded)} chars)"
+    )
+    return decoded
 
-        try:
-            repo = user.get_repo(task)
-        except GithubException as e:
-            if e.status == 404:
-                print(f"Repository '{task}' not found (this is OK for first time)")
-                return None
-            elif e.status == 403:
-                print(f"Permission denied accessing repository '{task}'")
-                return None
-            else:
-                print(f"Error accessing repository '{task}': {str(e)}")
-                return None
+
+def get_existing_code(task: str, path: str = "index.html") -> Optional[str]:
+    stored = _read_deployed_code(task, path)
+    if stored is not None:
+        return stored
+
+    try:
+        repo_cache = get_repo_cache()
+        # Lazy handle: a missing repository shows up as a 404 from get_contents
+        repo = repo_cache.get(task)
 
         try:
             contents = repo.get_contents(path, ref="main")
@@ -39,7 +102,13 @@ def get_existing_code(task: str, path: str = "index.html") -> Optional[str]:
                 return None
         except GithubException as e:
             if e.status == 404:
-                print(f"File '{path}' not found in repository '{task}' (this is OK)")
+                repo_cache.invalidate(task)
+                print(
+                    f"Repository '{task}' or its {path} not found (this is OK for first time)"
+                )
+                return None
+            elif e.status == 403:
+                print(f"Permission denied accessing repository '{task}'")
                 return None
             else:
                 print(f"Error fetching {path} from {task}: {str(e)}")
@@ -50,6 +119,15 @@ def get_existing_code(task: str, path: str = "index.html") -> Optional[str]:
         return None
 
 
+def get_repo_urls(task: str) -> Tuple[str, str]:
+    """Return (repo_url, pages_url) for a task without touching the repository."""
+    owner = get_repo_cache().login()
+    return (
+        f"https://github.com/{owner}/{task}",
+        f"https://{owner}.github.io/{task}/",
+    )
+
+
 def get_mit_license() -> str:
     year = "2025"
     name = GITHUB_USERNAME or "Student"
@@ -86,71 +164,67 @@ def create_or_update_repo(
 
     CONCURRENCY SAFETY:
     - Multiple requests with DIFFERENT task names → Safe (different repos)
-    - Multiple requests with SAME task name → Safe due to:
+    - Multiple requests with SAME task name → Serialized by the per-task lock
+      in utils/task_locks.py (lowest round first, stale rounds rejected); as a
+      fallback for other writers:
         1. GitHub repo creation race condition handling (catches 422 "already exists")
-        2. SHA-based conflict detection in upsert_pages_index (retries on conflicts)
+        2. DeploymentWriter rebasing its commit when the branch moved underneath it
     - Each Flask request runs in isolation, so local variables and return values
       are thread-safe (calculator request gets calculator URL, not counter URL)
+
+    All files for the round (index.html, extracted assets, LICENSE and README.md
+    when present in code_files) are written in a single commit.
+    """
+    repo_state = prepare_repo(task, round_num)
+    return deploy_to_repo(repo_state, task, code_files, round_num)
+
+
+def prepare_repo(task: str, round_num: int = 1) -> Dict[str, Any]:
     """
+    Get or create the repository for a task. For an existing repository the
+    Pages configuration is ensured too, since neither depends on generated code.
+
+    Returns:
+        Dict with repo, owner, repo_name, created and pages_configured
+        (None when Pages still has to be set up after the first commit)
+    """
+    repo_cache = get_repo_cache()
     try:
-        github_client = get_github_client()
-        user = github_client.get_user()
+        owner = repo_cache.login()
     except Exception as e:
         print(f"Failed to authenticate with GitHub: {str(e)}")
         print("Please check your GITHUB_TOKEN in .env file")
         raise
 
     repo_name = task
-    owner = user.login
 
     repo = None
-    existing_repo = None
+    created = False
     try:
-        existing_repo = user.get_repo(repo_name)
+        repo = repo_cache.get(repo_name, verify=True)
         print(
             f"Repository {repo_name} already exists, updating for round {round_num}..."
         )
-        repo = existing_repo
     except GithubException as e:
         if e.status == 404:
             print(f"Creating new repository {repo_name}...")
             try:
+                # auto_init gives the repo a branch, which the Git Data API needs
+                user = get_github_client().get_user()
                 repo = user.create_repo(
                     name=repo_name,
                     description=f"Generated app for task: {task}",
                     private=False,
-                    auto_init=False,
+                    auto_init=True,
                 )
+                created = True
+                repo_cache.put(repo_name, repo)
+                # A repository of the same name may have been deleted and recreated
+                pages_state = get_pages_state()
+                if pages_state is not None:
+                    pages_state.invalidate(owner, repo_name)
                 print(f"Repository {repo_name} created successfully")
-
-                try:
-                    repo.create_file(
-                        path="LICENSE",
-                        message="Add MIT License",
-                        content=get_mit_license(),
-                    )
-                    print("LICENSE file created")
-                except GithubException as license_error:
-                    if license_error.status == 422:
-                        print("LICENSE already exists, skipping...")
-                    else:
-                        print(
-                            f"Warning: Could not create LICENSE: {str(license_error)}"
-                        )
-
-                try:
-                    repo.create_file(
-                        path="README.md",
-                        message="Add README",
-                        content=f"# {task}\n\nGenerated application for {task}",
-                    )
-                    print("README.md created")
-                except GithubException as readme_error:
-                    if readme_error.status == 422:
-                        print("README.md already exists, will be updated later...")
-                    else:
-                        print(f"Warning: Could not create README: {str(readme_error)}")
-
+                register_webhook(repo)
             except GithubException as create_error:
                 if (
                     create_error.status == 422
@@ -160,7 +234,7 @@ def create_or_update_repo(
                         f"Repository {repo_name} was just created by another process, fetching it..."
                     )
                     try:
-                        repo = user.get_repo(repo_name)
+                        repo = repo_cache.get(repo_name, verify=True)
                     except GithubException as fetch_error:
                         raise RuntimeError(
                             f"Repository creation race condition: cannot fetch {repo_name} after failed create. {str(fetch_error)}"
@@ -175,19 +249,70 @@ def create_or_update_repo(
     if repo is None:
         raise RuntimeError(f"Failed to get or create repository {repo_name}")
 
+    # A brand-new repo only has the auto_init commit; enabling Pages now would
+    # publish that instead of the app, so it is done after the deployment commit
+    pages_configured = None
+    if not created:
+        try:
+            pages_configured = ensure_pages_site(owner, repo_name, branch="main")
+        except Exception as e:
+            print(f"Warning: Pages setup failed, will retry after deployment: {str(e)}")
+
+    return {
+        "repo": repo,
+        "owner": owner,
+        "repo_name": repo_name,
+        "created": created,
+        "pages_configured": pages_configured,
+    }
+
+
+def deploy_to_repo(
+    repo_state: Dict[str, Any],
+    task: str,
+    code_files: Dict[str, str],
+    round_num: int,
+) -> Dict[str, Any]:
+    """
+    Publish code_files to a repository returned by prepare_repo() as a single
+    commit and wait for GitHub Pages to serve it.
+
+    Returns:
+        Dict with repo_url, commit_sha, pages_url, repo and deployed. deployed
+        is False when this run neither made the commit nor found the files
+        already on the branch; commit_sha is then only the branch head.
+    """
+    repo = repo_state["repo"]
+    owner = repo_state["owner"]
+    repo_name = repo_state["repo_name"]
+    created = repo_state["created"]
+
+    writer = DeploymentWriter(repo, branch="main")
+    if created:
+        writer.add_file("LICENSE", get_mit_license())
+
+    readme_content = code_files.get("README.md")
+    if readme_content:
+        writer.add_file("README.md", readme_content)
+    elif created:
+        writer.add_file("README.md", f"# {task}\n\nGenerated application for {task}")
+
     index_content = code_files.get(
         "index.html", "<html><body><h1>Welcome</h1></body></html>"
     )
 
     print("Processing HTML assets (extracting large base64 data URIs)...")
     try:
-        index_content = process_html_assets(index_content, repo, round_num)
+        index_content = process_html_assets(
+            index_content, repo, round_num, writer=writer
+        )
     except Exception as e:
         print(f"Warning: Asset processing failed: {str(e)}")
         print("Continuing with original HTML (data URIs intact)...")
 
+    latest_commit_sha = None
     try:
-        upsert_pages_index(
+        latest_commit_sha = upsert_pages_index(
             owner=owner,
             repo_name=repo_name,
             html=index_content,
@@ -195,25 +320,46 @@ def create_or_update_repo(
             path="index.html",
             commit_msg=f"Deploy app for round {round_num}",
             round_num=round_num,
+            writer=writer,
+            pages_configured=repo_state.get("pages_configured"),
         )
     except Exception as e:
+        if isinstance(e, GithubException) and e.status == 404:
+            get_repo_cache().invalidate(repo_name, owner)
+            pages_state = get_pages_state()
+            if pages_state is not None:
+                pages_state.invalidate(owner, repo_name)
         print(f"Error during Pages setup: {str(e)}")
         print("Continuing despite Pages setup issues (file should be uploaded)...")
 
-    try:
-        commits = repo.get_commits()
-        latest_commit_sha = commits[0].sha
-    except Exception as e:
-        print(f"Warning: Could not fetch latest commit: {str(e)}")
-        latest_commit_sha = "unknown"
+    store = get_artifact_store()
+    if latest_commit_sha and store is not None:
+        deployed = {"index.html": index_content}
+        if readme_content:
+            deployed["README.md"] = readme_content
+        try:
+            store.record_deployment(task, owner, latest_commit_sha, deployed)
+        except Exception as e:
+            print(f"Warning: Could not store deployed files locally: {str(e)}")
+
+    if not latest_commit_sha:
+        try:
+            commits = repo.get_commits()
+            latest_commit_sha = commits[0].sha
+        except Exception as e:
+            print(f"Warning: Could not fetch latest commit: {str(e)}")
+            latest_commit_sha = "unknown"
 
     pages_url = f"https://{owner}.github.io/{repo_name}/"
 
     return {
-        "repo_url": repo.html_url,
+        # Built locally so a lazy repository handle is never completed just for its URL
+        "repo_url": f"https://github.com/{owner}/{repo_name}",
         "commit_sha": latest_commit_sha,
         "pages_url": pages_url,
         "repo": repo,
+        # Set by writer.commit(), even if the Pages setup after it failed
+        "deployed": writer.changed is not None,
     }
 
 
@@ -225,68 +371,171 @@ def upsert_pages_index(
     path: str = "index.html",
     commit_msg: Optional[str] = None,
     round_num: Optional[int] = None,
-) -> None:
+    writer: Optional[DeploymentWriter] = None,
+    pages_configured: Optional[bool] = None,
+) -> Optional[str]:
+    """
+    Commit html to path (together with anything already staged on writer),
+    make sure GitHub Pages serves the branch and wait for the site to go live.
+    When every file is already on the branch unchanged, no commit is made
+    and the wait is skipped.
+    Pass pages_configured when ensure_pages_site() already ran for this repo.
+
+    Returns:
+        SHA of the deployment commit
+    """
     commit_msg = commit_msg or f"Update {path} for GitHub Pages"
 
-    gh = get_github_client()
-    repo = gh.get_repo(f"{owner}/{repo_name}")
+    if writer is None:
+        writer = DeploymentWriter(
+            get_repo_cache().get(repo_name, owner=owner), branch=branch
+        )
 
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            contents = repo.get_contents(path, ref=branch)
-            repo.update_file(
-                path=path,
-                message=commit_msg,
-                content=html,
-                sha=contents.sha,
-                branch=branch,
+    writer.add_file(path, html)
+    commit_sha = writer.commit(commit_msg)
+    print(f"{path} deployed on {branch}")
+
+    if pages_configured is None:
+        pages_configured = ensure_pages_site(owner, repo_name, branch)
+
+    if writer.changed is False:
+        # Nothing was committed, so no build is queued and the live site is current
+        print("Deployment is identical to the live site, skipping Pages wait")
+        return commit_sha
+
+    # The deployment commit (or enabling Pages for the first time) already queues
+    # exactly one Pages build, so wait for it instead of requesting another one
+    if pages_configured:
+        print("Waiting for Pages to become available...")
+        pages_url = f"https://{owner}.github.io/{repo_name}/"
+        poller = get_pages_poller()
+
+        if commit_sha:
+            check = _pages_build_check(
+                owner,
+                repo_name,
+                commit_sha,
+                pages_url,
+                expected_blob=git_blob_sha(html) if path == "index.html" else None,
             )
-            print(f"{path} updated on {branch}")
-            break
-        except GithubException as e:
-            if getattr(e, "status", None) == 404 or "Not Found" in str(e):
+            # With webhooks the page_build event normally resolves the wait first
+            not_before = poller.fallback_delay() if webhooks_enabled() else None
+        else:
+            http = get_http_session()
+
+            def check() -> bool:
                 try:
-                    repo.create_file(
-                        path=path,
-                        message=f"Add {path} for GitHub Pages",
-                        content=html,
-                        branch=branch,
-                    )
-                    print(f"{path} created on {branch}")
-                    break
-                except GithubException as create_error:
-                    if (
-                        create_error.status == 422
-                        and "sha" in str(create_error).lower()
-                    ):
-                        if attempt < max_retries - 1:
-                            print(
-                                f"File created by concurrent request, retrying update (attempt {attempt + 2}/{max_retries})..."
-                            )
-                            time.sleep(1)
-                            continue
-                        else:
-                            raise RuntimeError(
-                                f"Failed to create {path} after {max_retries} attempts due to concurrent operations"
-                            )
-                    else:
-                        raise
-            elif e.status == 409 or (
-                "sha" in str(e).lower() and "does not match" in str(e).lower()
+                    return http.get(pages_url, timeout=10).status_code == 200
+                except RequestException:
+                    return False
+
+            # On later rounds the previous deployment already answers 200, so don't
+            # trust a check earlier than the shortest build time seen so far
+            not_before = poller.learned_not_before() if (round_num or 1) > 1 else None
+
+        try:
+            if not poller.wait_until_live(
+                pages_url, check, timeout=300, not_before=not_before, commit=commit_sha
             ):
-                if attempt < max_retries - 1:
-                    print(
-                        f"SHA conflict detected (concurrent update), retrying (attempt {attempt + 2}/{max_retries})..."
-                    )
-                    time.sleep(1)
-                    continue
-                else:
-                    raise RuntimeError(
-                        f"Failed to update {path} after {max_retries} attempts due to concurrent updates"
-                    )
-            else:
-                raise
+                print("Timeout: GitHub Pages did not go live within the expected time.")
+                # The site may have been disabled behind our back, check it next round
+                pages_state = get_pages_state()
+                if pages_state is not None:
+                    pages_state.invalidate(owner, repo_name)
+        except Exception as e:
+            print(f"Warning: error while waiting for Pages: {str(e)}")
+        print("Pages build polling complete (may still be finalizing on GitHub's side)")
+
+    return commit_sha
+
+
+def _pages_build_check(
+    owner: str,
+    repo_name: str,
+    commit_sha: str,
+    pages_url: str,
+    expected_blob: Optional[str] = None,
+) -> Callable[[], bool]:
+    """
+    Readiness check for the Pages build of commit_sha. Polls the latest build
+    with If-None-Match, so checks while nothing changed are answered with a 304
+    that does not count against the rate limit. With PAGES_VERIFY_CONTENT and
+    expected_blob set, the served page must also have that git blob SHA.
+    """
+    url = f"https://api.github.com/repos/{owner}/{repo_name}/pages/builds/latest"
+    hdrs = {
+        "Accept": "application/vnd.github+json",
+        "Authorization": f"Bearer {GITHUB_TOKEN}",
+        "X-GitHub-Api-Version": "2022-11-28",
+    }
+    http = get_http_session()
+    state = {"etag": None, "built": False}
+
+    def served_content_matches() -> bool:
+        try:
+            # The query string keeps the CDN from answering with the previous version
+            r = http.get(pages_url, params={"v": commit_sha[:7]}, timeout=10)
+        except RequestException:
+            return False
+        return r.status_code == 200 and git_blob_sha(r.content) == expected_blob
+
+    def check() -> bool:
+        if state["built"]:
+            return served_content_matches()
+
+        request_headers = dict(hdrs)
+        if state["etag"]:
+            request_headers["If-None-Match"] = state["etag"]
+        try:
+            r = github_request("GET", url, priority=POLL, headers=request_headers, timeout=10)
+        except RequestException:
+            return False
+
+        if r.status_code == 304:
+            return False
+        if r.status_code == 404:
+            pages_state = get_pages_state()
+            if pages_state is not None:
+                pages_state.invalidate(owner, repo_name)
+            return False
+        if r.status_code != 200:
+            print(f"Unexpected response from Pages builds API: {r.status_code}")
+            return False
+
+        state["etag"] = r.headers.get("ETag")
+        build = r.json()
+        if build.get("commit") != commit_sha:
+            return False
+        status = build.get("status")
+        if status == "errored":
+            message = (build.get("error") or {}).get("message")
+            print(f"Pages build for {commit_sha[:7]} failed: {message}")
+            get_pages_poller().resolve(pages_url, live=False, commit=commit_sha)
+            return False
+        if status != "built":
+            return False
+
+        state["built"] = True
+        if PAGES_VERIFY_CONTENT and expected_blob:
+            return served_content_matches()
+        return True
+
+    return check
+
+
+def ensure_pages_site(owner: str, repo_name: str, branch: str = "main") -> bool:
+    """
+    Create the GitHub Pages site for a repository or make sure it serves
+    branch from the root. Repositories recorded as configured in the Pages
+    state store are trusted without calling the API.
+
+    Returns:
+        True if Pages is configured
+    """
+    pages_state = get_pages_state()
+    if pages_state is not None and pages_state.is_configured(owner, repo_name, branch):
+        print(f"Pages already configured for {owner}/{repo_name}, skipping Pages API")
+        return True
 
     base = "https://api.github.com"
     hdrs = {
@@ -301,8 +550,8 @@ def upsert_pages_index(
 
     for attempt in range(max_retries):
         try:
-            r = requests.get(
-                f"{base}/repos/{owner}/{repo_name}/pages", headers=hdrs, timeout=10
+            r = github_request(
+                "GET", f"{base}/repos/{owner}/{repo_name}/pages", headers=hdrs, timeout=10
             )
 
             if r.status_code == 404:
@@ -310,7 +559,8 @@ def upsert_pages_index(
                     f"GitHub Pages not found, creating (attempt {attempt + 1}/{max_retries})..."
                 )
                 body = {"source": {"branch": branch, "path": "/"}}
-                cr = requests.post(
+                cr = github_request(
+                    "POST",
                     f"{base}/repos/{owner}/{repo_name}/pages",
                     headers=hdrs,
                     json=body,
@@ -347,9 +597,19 @@ def upsert_pages_index(
                         break
 
             elif r.status_code == 200:
+                try:
+                    source = r.json().get("source") or {}
+                except ValueError:
+                    source = {}
+                if source.get("branch") == branch and source.get("path") == "/":
+                    print("Pages site exists with the expected source")
+                    pages_configured = True
+                    break
+
                 print("Pages site exists, ensuring correct configuration...")
                 body = {"source": {"branch": branch, "path": "/"}}
-                pr = requests.patch(
+                pr = github_request(
+                    "PATCH",
                     f"{base}/repos/{owner}/{repo_name}/pages",
                     headers=hdrs,
                     json=body,
@@ -435,76 +695,9 @@ def upsert_pages_index(
                 )
                 break
 
-    # Request a fresh build and wait for it to complete
-    # Note: The build request returns 201/202 immediately, but the actual build takes time
-    if pages_configured:
-        try:
-            print("Requesting Pages build...")
-            br = requests.post(
-                f"{base}/repos/{owner}/{repo_name}/pages/builds",
-                headers=hdrs,
-                timeout=10,
-            )
-
-            if br.status_code in (201, 202):
-                print(
-                    "Pages build started successfully. Waiting for Pages to become available..."
-                )
-
-                def wait_for_github_pages(url: str, timeout: int = 600) -> bool:
-                    print(f"Waiting for GitHub Pages to become live at: {url}")
-                    start = time.time()
-
-                    initial_wait = 30
-                    time_elapsed = time.time() - start
-                    if time_elapsed < timeout:
-                        to_wait = min(initial_wait, timeout - time_elapsed)
-                        if to_wait > 0:
-                            print(
-                                f"Initial wait for {to_wait} seconds before first check..."
-                            )
-                            time.sleep(to_wait)
-
-                    delay = 30 if round_num == 1 else 120
-
-                    while time.time() - start < timeout:
-                        try:
-                            r = requests.get(url, timeout=10)
-                            if r.status_code == 200:
-                                print(f"GitHub Pages is live at: {url}")
-                                return True
-                            else:
-                                print(f"Still building... (status: {r.status_code})")
-                        except RequestException:
-                            print("Still building... (no response)")
-
-                        remaining = timeout - (time.time() - start)
-                        if remaining <= 0:
-                            break
-                        sleep_time = min(delay, remaining)
-                        time.sleep(sleep_time)
-
-                    print(
-                        "Timeout: GitHub Pages did not go live within the expected time."
-                    )
-                    return False
-
-                try:
-                    wait_for_github_pages(
-                        f"https://{owner}.github.io/{repo_name}/", timeout=300
-                    )
-                except Exception as e:
-                    print(f"Warning: error while waiting for Pages: {str(e)}")
-                print(
-                    "Pages build polling complete (may still be finalizing on GitHub's side)"
-                )
-            else:
-                print(
-                    f"Pages build request returned {br.status_code}: {br.text} (non-critical, Pages will build automatically)"
-                )
-        except Exception as e:
-            print(f"Could not request Pages build (non-critical): {str(e)}")
-            print("Pages will build automatically in the background")
+    if pages_configured and pages_state is not None:
+        pages_state.mark_configured(owner, repo_name, branch)
+    return pages_configured
 
 
 def update_readme(repo, task: str, brief: str, repo_url: str, pages_url: str):
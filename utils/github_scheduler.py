@@ -0,0 +1,319 @@
+"""
+Rate-limit aware scheduler for GitHub API calls.
+Every call, whether raw REST through github_request() or made by PyGithub,
+takes a slot first. Slots are granted by priority, so deployment writes go
+before reads and Pages readiness polls. The scheduler tracks limits from the
+response headers:
+- the primary limit comes from X-RateLimit-Remaining and X-RateLimit-Reset;
+- secondary limits show up as Retry-After or a 403/429, and pause every call.
+Content-creating calls run under an AIMD concurrency limit that halves on
+every secondary limit and grows back by one per limit's worth of successes.
+Near the primary limit, reads and polls are spread over the time left until
+the reset and stop at GITHUB_RATE_RESERVE, so commits can still go through.
+"""
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from io import IOBase
+from typing import Callable, Optional
+
+import requests
+from github.Requester import (
+    HTTPRequestsConnectionClass,
+    HTTPSRequestsConnectionClass,
+    Requester,
+    RequestsResponse,
+)
+
+from .config import (
+    get_http_session,
+    GITHUB_MAX_CONCURRENCY,
+    GITHUB_WRITE_CONCURRENCY,
+    GITHUB_RATE_RESERVE,
+)
+
+# Priorities, lowest value first
+COMMIT = 0
+READ = 1
+POLL = 2
+
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+# GitHub asks clients to wait at least a minute after a secondary limit without Retry-After
+SECONDARY_LIMIT_WAIT = 60
+# Longer waits are not retried; the caller gets the error response instead
+MAX_RETRY_WAIT = 300
+# Below this many remaining requests, reads and polls are paced
+PACE_BELOW = 1000
+
+
+class GitHubScheduler:
+    def __init__(
+        self,
+        max_concurrency: int = GITHUB_MAX_CONCURRENCY,
+        write_concurrency: int = GITHUB_WRITE_CONCURRENCY,
+        reserve: int = GITHUB_RATE_RESERVE,
+    ):
+        """
+        Args:
+            max_concurrency: Maximum GitHub calls in flight
+            write_concurrency: Upper bound of the adaptive limit on concurrent writes
+            reserve: Remaining primary quota kept for commits only
+        """
+        self.max_concurrency = max_concurrency
+        self.max_write_limit = float(write_concurrency)
+        self.write_limit = float(write_concurrency)
+        self.reserve = reserve
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self.paused_until = 0.0
+        self._next_paced = 0.0
+        self._active = 0
+        self._writes = 0
+        self._waiting: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _blocked_for(self, priority: int, now: float) -> float:
+        """Seconds until a call of this priority may start (0 if it may start now)."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.remaining is None or now >= self.reset_at:
+            return 0
+        if self.remaining <= 0:
+            return self.reset_at - now
+        if priority == COMMIT or self.remaining >= PACE_BELOW:
+            return 0
+        if self.remaining <= self.reserve:
+            return self.reset_at - now
+        return max(0.0, self._next_paced - now)
+
+    def _has_capacity(self, write: bool) -> bool:
+        if self._active >= self.max_concurrency:
+            return False
+        return not write or self._writes < int(self.write_limit)
+
+    def _first_eligible(self, now: float):
+        for ticket in sorted(self._waiting):
+            priority, _, write = ticket
+            if self._blocked_for(priority, now) == 0 and self._has_capacity(write):
+                return ticket
+        return None
+
+    @contextmanager
+    def slot(self, priority: int = READ, write: bool = False):
+        """Hold one of the concurrency slots for a GitHub call."""
+        ticket = (priority, next(self._seq), write)
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.time()
+                    delay = self._blocked_for(priority, now)
+                    if delay == 0 and self._first_eligible(now) == ticket:
+                        break
+                    self._cond.wait(delay if delay > 0 else None)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+            self._active += 1
+            if write:
+                self._writes += 1
+            if self.remaining is not None and now < self.reset_at:
+                self.remaining -= 1
+                if priority != COMMIT and self.remaining < PACE_BELOW:
+                    budget = max(1, self.remaining - self.reserve)
+                    self._next_paced = max(now, self._next_paced) + (self.reset_at - now) / budget
+            # Capacity may be left for the next waiter in line
+            self._cond.notify_all()
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                if write:
+                    self._writes -= 1
+                self._cond.notify_all()
+
+    def observe(self, response: requests.Response, write: bool = False) -> Optional[float]:
+        """
+        Update limits from a response.
+
+        Returns:
+            Seconds to wait before retrying if the call was rate limited, else None
+        """
+        headers = response.headers
+        now = time.time()
+        wait = None
+        with self._cond:
+            resource = headers.get("X-RateLimit-Resource", "core")
+            if resource == "core" and "X-RateLimit-Remaining" in headers:
+                try:
+                    self.remaining = int(headers["X-RateLimit-Remaining"])
+                    self.reset_at = float(headers.get("X-RateLimit-Reset", 0))
+                except ValueError:
+                    pass
+
+            if response.status_code in (403, 429):
+                retry_after = headers.get("Retry-After")
+                if retry_after:
+                    try:
+                        wait = max(1.0, float(retry_after))
+                    except ValueError:
+                        wait = SECONDARY_LIMIT_WAIT
+                elif resource == "core" and headers.get("X-RateLimit-Remaining") == "0":
+                    wait = max(1.0, self.reset_at - now)
+                elif response.status_code == 429 or "secondary rate limit" in response.text.lower():
+                    wait = SECONDARY_LIMIT_WAIT
+
+            if wait is not None:
+                self.paused_until = max(self.paused_until, now + wait)
+                if write:
+                    self.write_limit = max(1.0, self.write_limit / 2)
+            elif write and response.status_code < 400:
+                self.write_limit = min(self.max_write_limit, self.write_limit + 1 / self.write_limit)
+            self._cond.notify_all()
+        return wait
+
+    def call(
+        self,
+        send: Callable[[], requests.Response],
+        priority: int = READ,
+        write: bool = False,
+        retry: bool = True,
+        max_attempts: int = 3,
+    ) -> requests.Response:
+        """
+        Run send() in a slot and retry it after rate limits. A rate-limited
+        request was not processed by GitHub, so retrying a write is safe.
+        """
+        for attempt in range(max_attempts):
+            with self.slot(priority, write):
+                response = send()
+            wait = self.observe(response, write)
+            if wait is None or not retry or attempt == max_attempts - 1 or wait > MAX_RETRY_WAIT:
+                return response
+            print(
+                f"GitHub rate limit hit ({response.status_code}), retrying in {wait:.0f}s "
+                f"(attempt {attempt + 2}/{max_attempts})..."
+            )
+        return response
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                "remaining": self.remaining,
+                "reset_at": self.reset_at,
+                "paused_until": self.paused_until,
+                "write_limit": self.write_limit,
+                "active": self._active,
+                "waiting": len(self._waiting),
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_github_scheduler() -> GitHubScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = GitHubScheduler()
+    return _scheduler
+
+
+def github_request(method: str, url: str, priority: int = READ, **kwargs) -> requests.Response:
+    """Raw GitHub REST call through the shared session and the scheduler."""
+    method = method.upper()
+    write = method in WRITE_METHODS
+    if priority == READ and write:
+        priority = COMMIT
+    http = get_http_session()
+    return get_github_scheduler().call(
+        lambda: http.request(method, url, **kwargs), priority=priority, write=write
+    )
+
+
+class ScheduledHTTPSConnection(HTTPSRequestsConnectionClass):
+    """
+    PyGithub connection that sends through the shared session and the
+    scheduler. Connections are cheap, so each request gets its own and
+    concurrent threads never share PyGithub's per-connection request state.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: Optional[int] = None,
+        strict: bool = False,
+        timeout: Optional[int] = None,
+        retry=None,
+        pool_size=None,
+        **kwargs,
+    ):
+        # Retries and pooling come from the shared session instead
+        self.port = port if port else 443
+        self.host = host
+        self.protocol = "https"
+        self.timeout = timeout
+        self.verify = kwargs.get("verify", True)
+        self.session = get_http_session()
+
+    def request(
+        self,
+        verb: str,
+        url: str,
+        input,
+        headers: dict,
+        stream: bool = False,
+    ) -> None:
+        self.verb = verb
+        self.url = url
+        self.input = input
+        self.headers = headers
+        self.stream = stream
+
+    def getresponse(self) -> RequestsResponse:
+        url = f"{self.protocol}://{self.host}:{self.port}{self.url}"
+        write = self.verb.upper() in WRITE_METHODS
+
+        def send() -> requests.Response:
+            return self.session.request(
+                self.verb,
+                url,
+                headers=self.headers,
+                data=self.input,
+                timeout=self.timeout,
+                verify=self.verify,
+                allow_redirects=False,
+                stream=self.stream,
+                # Like PyGithub's own session auth, keeps requests from falling back to .netrc
+                auth=Requester.noopAuth,
+            )
+
+        response = get_github_scheduler().call(
+            send,
+            priority=COMMIT if write else READ,
+            write=write,
+            # A streamed upload cannot be sent twice
+            retry=not isinstance(self.input, IOBase),
+        )
+        return RequestsResponse(response)
+
+    def close(self) -> None:
+        # The session is shared with the rest of the process
+        pass
+
+
+def install_pygithub_scheduler() -> None:
+    """Route every PyGithub request through the scheduler."""
+    Requester.injectConnectionClasses(HTTPRequestsConnectionClass, ScheduledHTTPSConnection)
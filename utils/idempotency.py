@@ -0,0 +1,169 @@
+"""
+Idempotency store for /api-endpoint deliveries.
+Requests are keyed by (email, task, round, nonce) in a local SQLite database.
+A duplicate of a finished request gets the stored response back; a duplicate of
+one still running waits for it (or is pointed at its job) instead of re-running
+the pipeline. Failed requests are forgotten so a retry runs again.
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .cache import make_cache_key
+from .config import IDEMPOTENCY_DB, IDEMPOTENCY_TTL, IDEMPOTENCY_INFLIGHT_TTL
+
+IN_FLIGHT = "in_flight"
+COMPLETED = "completed"
+
+
+def idempotency_key(data: Dict[str, Any]) -> str:
+    return make_cache_key(
+        data.get("email", ""),
+        data.get("task", ""),
+        data.get("round", 1),
+        data.get("nonce", ""),
+    )
+
+
+class IdempotencyStore:
+    def __init__(
+        self,
+        path: str,
+        ttl: float = IDEMPOTENCY_TTL,
+        inflight_ttl: float = IDEMPOTENCY_INFLIGHT_TTL,
+    ):
+        """
+        Args:
+            path: SQLite database file
+            ttl: Seconds a completed response is kept
+            inflight_ttl: Seconds after which an unfinished record is assumed
+                abandoned (e.g. the process died) and may be taken over
+        """
+        self.ttl = ttl
+        self.inflight_ttl = inflight_ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS requests (
+                key TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                job_id TEXT,
+                response TEXT,
+                status_code INTEGER,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._lock = threading.Lock()
+        self._events: Dict[str, threading.Event] = {}
+        self._last_purge = 0.0
+
+    def begin(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Claim key for a new run.
+
+        Returns:
+            None if the caller now owns the request, otherwise the existing
+            record (state, job_id, response, status_code)
+        """
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            self._conn.execute(
+                "DELETE FROM requests WHERE key = ? AND state = ? AND updated_at < ?",
+                (key, IN_FLIGHT, now - self.inflight_ttl),
+            )
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO requests (key, state, updated_at) VALUES (?, ?, ?)",
+                (key, IN_FLIGHT, now),
+            )
+            if cursor.rowcount == 1:
+                self._events[key] = threading.Event()
+                return None
+        return self.get(key)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, job_id, response, status_code FROM requests WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "state": row[0],
+            "job_id": row[1],
+            "response": json.loads(row[2]) if row[2] else None,
+            "status_code": row[3],
+        }
+
+    def set_job(self, key: str, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE requests SET job_id = ? WHERE key = ?", (job_id, key)
+            )
+
+    def finish(self, key: str, response: Dict[str, Any], status_code: int) -> None:
+        """Store a successful response; an error response drops the record instead."""
+        with self._lock:
+            if status_code < 400:
+                self._conn.execute(
+                    "UPDATE requests SET state = ?, response = ?, status_code = ?, updated_at = ? WHERE key = ?",
+                    (COMPLETED, json.dumps(response), status_code, time.time(), key),
+                )
+            else:
+                self._conn.execute("DELETE FROM requests WHERE key = ?", (key,))
+            event = self._events.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def abandon(self, key: str) -> None:
+        """Forget a claimed key without a result, so the next delivery runs it."""
+        with self._lock:
+            self._conn.execute("DELETE FROM requests WHERE key = ?", (key,))
+            event = self._events.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def wait(self, key: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Wait for an in-flight request owned by this process to finish.
+
+        Returns:
+            The record afterwards (None if the run failed and was dropped)
+        """
+        with self._lock:
+            event = self._events.get(key)
+        if event is not None:
+            event.wait(timeout)
+        return self.get(key)
+
+    def _purge(self, now: float) -> None:
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        self._conn.execute(
+            "DELETE FROM requests WHERE state = ? AND updated_at < ?",
+            (COMPLETED, now - self.ttl),
+        )
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store() -> Optional[IdempotencyStore]:
+    """Shared store, or None when IDEMPOTENCY_DB is empty or unusable."""
+    global _store
+    if _store is None and IDEMPOTENCY_DB:
+        with _store_lock:
+            if _store is None:
+                try:
+                    _store = IdempotencyStore(IDEMPOTENCY_DB)
+                except sqlite3.Error as e:
+                    print(f"Warning: Idempotency store disabled: {str(e)}")
+                    return None
+    return _store
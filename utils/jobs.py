@@ -0,0 +1,190 @@
+"""
+Background job queue for the asynchronous /api-endpoint mode.
+Runs deployment pipelines on a bounded in-process worker pool and keeps
+per-stage status so callers can poll GET /jobs/<id>.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .config import JOB_WORKERS, JOB_QUEUE_SIZE, JOB_RETENTION_SECONDS
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when the worker pool and its pending queue are both full."""
+
+
+class Job:
+    def __init__(self, metadata: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex
+        self.metadata = metadata or {}
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.stages: List[Dict[str, Any]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.status_code: Optional[int] = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def _find_stage(self, name: str) -> Optional[Dict[str, Any]]:
+        for stage in self.stages:
+            if stage["name"] == name:
+                return stage
+        return None
+
+    def start_stage(self, name: str) -> None:
+        """Mark a stage as running. Several stages may run at the same time."""
+        with self._lock:
+            stage = self._find_stage(name)
+            if stage is None:
+                stage = {"name": name}
+                self.stages.append(stage)
+            stage.update(
+                {"status": "running", "started_at": time.time(), "finished_at": None}
+            )
+
+    def finish_stage(
+        self,
+        name: str,
+        status: str = "completed",
+        error: Optional[str] = None,
+        details: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        with self._lock:
+            stage = self._find_stage(name)
+            if stage is None:
+                stage = {"name": name, "started_at": None}
+                self.stages.append(stage)
+            stage["status"] = status
+            stage["finished_at"] = time.time()
+            if stage.get("started_at"):
+                stage["duration"] = stage["finished_at"] - stage["started_at"]
+            if error:
+                stage["error"] = error
+            if details:
+                stage["details"] = details
+
+    def _close_running_stages(self, status: str) -> None:
+        now = time.time()
+        for stage in self.stages:
+            if stage["status"] == "running":
+                stage["status"] = status
+                stage["finished_at"] = now
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            data = {
+                "job_id": self.id,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "stages": [dict(stage) for stage in self.stages],
+                **self.metadata,
+            }
+            if self.result is not None:
+                data["result"] = self.result
+                data["status_code"] = self.status_code
+            if self.error:
+                data["error"] = self.error
+            return data
+
+
+class JobManager:
+    def __init__(
+        self,
+        max_workers: int = JOB_WORKERS,
+        max_pending: int = JOB_QUEUE_SIZE,
+        retention_seconds: int = JOB_RETENTION_SECONDS,
+    ):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job-worker"
+        )
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._retention_seconds = retention_seconds
+
+    def submit(
+        self,
+        fn: Callable[[Job], tuple],
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> Job:
+        """
+        Queue fn(job) for execution. fn must return (response_dict, status_code).
+
+        Raises:
+            JobQueueFull: if no worker or queue slot is available
+        """
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull("Job queue is full, try again later")
+
+        job = Job(metadata)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+
+        try:
+            self._executor.submit(self._run, job, fn)
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise
+
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job, fn: Callable[[Job], tuple]) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            response_data, status_code = fn(job)
+            with job._lock:
+                job.result = response_data
+                job.status_code = status_code
+                job.status = "succeeded" if status_code < 400 else "failed"
+                if status_code >= 400:
+                    job.error = response_data.get("message")
+                job._close_running_stages(
+                    "completed" if status_code < 400 else "failed"
+                )
+        except Exception as e:
+            print(f"Job {job.id} crashed: {str(e)}")
+            with job._lock:
+                job.status = "failed"
+                job.error = str(e)
+                job._close_running_stages("failed")
+        finally:
+            job.finished_at = time.time()
+            self._slots.release()
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self._retention_seconds
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    global _job_manager
+    if _job_manager is None:
+        with _job_manager_lock:
+            if _job_manager is None:
+                _job_manager = JobManager()
+    return _job_manager
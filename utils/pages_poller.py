@@ -0,0 +1,278 @@
+"""
+Shared GitHub Pages readiness poller.
+A single scheduler thread tracks every pending deployment, runs the readiness
+checks on a small worker pool and wakes the waiting request as soon as its site
+is live. Poll intervals follow the distribution of previously observed build times.
+The latest build reported through resolve() is kept for BUILD_REPORT_TTL seconds,
+so a webhook that arrives before its deployment starts waiting is not lost.
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .config import (
+    PAGES_POLL_MIN_INTERVAL,
+    PAGES_POLL_MAX_INTERVAL,
+    PAGES_POLL_WORKERS,
+)
+
+DEFAULT_NOT_BEFORE = 30
+DEFAULT_FALLBACK_DELAY = 60
+MIN_SAMPLES = 5
+SCHEDULE_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9, 0.95)
+# How long a build report without a waiting deployment is kept
+BUILD_REPORT_TTL = 600
+
+
+class PagesWatch:
+    def __init__(
+        self,
+        key: str,
+        check: Callable[[], bool],
+        timeout: float,
+        not_before: float = 0,
+        learn: bool = True,
+        commit: Optional[str] = None,
+    ):
+        self.key = key
+        self.check = check
+        self.commit = commit
+        self.registered_at = time.time()
+        self.deadline = self.registered_at + timeout
+        self.not_before = self.registered_at + not_before
+        self.learn = learn
+        self.event = threading.Event()
+        self.live = False
+        self.checks = 0
+
+    @property
+    def done(self) -> bool:
+        return self.event.is_set()
+
+    def finish(self, live: bool) -> None:
+        self.live = live
+        self.event.set()
+
+
+class PagesPoller:
+    def __init__(
+        self,
+        min_interval: float = PAGES_POLL_MIN_INTERVAL,
+        max_interval: float = PAGES_POLL_MAX_INTERVAL,
+        workers: int = PAGES_POLL_WORKERS,
+        history_size: int = 100,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="pages-check"
+        )
+        self._durations = deque(maxlen=history_size)
+        self._watches: Dict[str, List[PagesWatch]] = {}
+        # key -> (commit, live, reported_at) of the latest resolve()
+        self._reports: Dict[str, Tuple[Optional[str], bool, float]] = {}
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def wait_until_live(
+        self,
+        key: str,
+        check: Callable[[], bool],
+        timeout: float = 300,
+        not_before: Optional[float] = None,
+        commit: Optional[str] = None,
+    ) -> bool:
+        """
+        Block until check() reports the site as live, resolve(key) is called,
+        or timeout seconds pass.
+
+        Args:
+            key: Identifier of the deployment (usually the Pages URL)
+            check: Returns True once the deployment is live
+            timeout: Maximum seconds to wait
+            not_before: Seconds to wait before the first check. Use it when
+                check() cannot tell the new deployment from the previous one,
+                or when a webhook is expected to call resolve() first.
+            commit: SHA of the deployed commit; resolve() calls for another
+                commit leave this watch alone
+
+        Returns:
+            True if the site went live before the timeout
+        """
+        learn = not_before is None
+        if not_before is None:
+            not_before = 0
+        watch = PagesWatch(
+            key, check, timeout, not_before=not_before, learn=learn, commit=commit
+        )
+        self._register(watch)
+
+        watch.event.wait(timeout)
+        if not watch.done:
+            watch.finish(False)
+        with self._cond:
+            watches = self._watches.get(key, [])
+            if watch in watches:
+                watches.remove(watch)
+            if not watches:
+                self._watches.pop(key, None)
+        return watch.live
+
+    def resolve(self, key: str, live: bool = True, commit: Optional[str] = None) -> int:
+        """
+        Complete the watches registered for key, only those waiting for commit
+        when it is given. A build reported this way took exactly as long as
+        observed, so its duration is learned even for delayed watches. The
+        report is also kept for a watch on the same commit registered later.
+
+        Returns:
+            How many watches were woken
+        """
+        now = time.time()
+        with self._cond:
+            for stale in [k for k, r in self._reports.items() if now - r[2] > BUILD_REPORT_TTL]:
+                del self._reports[stale]
+            self._reports[key] = (commit, live, now)
+            watches = [
+                watch
+                for watch in self._watches.get(key, [])
+                if commit is None or watch.commit in (None, commit)
+            ]
+        woken = 0
+        for watch in watches:
+            if not watch.done:
+                self._finish(watch, live, exact=True)
+                woken += 1
+        return woken
+
+    def learned_not_before(self) -> float:
+        """Lower bound on build time learned so far, used for round 2+ deployments."""
+        samples = self._samples()
+        if len(samples) < MIN_SAMPLES:
+            return DEFAULT_NOT_BEFORE
+        return max(self.min_interval, _quantile(samples, 0.1))
+
+    def fallback_delay(self) -> float:
+        """Seconds before polling a deployment that a webhook should report first."""
+        samples = self._samples()
+        if len(samples) < MIN_SAMPLES:
+            return DEFAULT_FALLBACK_DELAY
+        return max(self.min_interval, _quantile(samples, 0.9))
+
+    def _samples(self) -> List[float]:
+        with self._cond:
+            return sorted(self._durations)
+
+    def _register(self, watch: PagesWatch) -> None:
+        first_check = max(
+            watch.not_before, watch.registered_at + self._next_delay(0)
+        )
+        with self._cond:
+            report = self._reports.get(watch.key)
+            if (
+                report is not None
+                and watch.commit is not None
+                and report[0] == watch.commit
+                and watch.registered_at - report[2] <= BUILD_REPORT_TTL
+            ):
+                # The build finished before we started waiting; its duration is unknown
+                watch.finish(report[1])
+                return
+            self._watches.setdefault(watch.key, []).append(watch)
+            heapq.heappush(self._heap, (first_check, next(self._seq), watch))
+            self._ensure_thread()
+            self._cond.notify()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="pages-poller", daemon=True
+            )
+            self._thread.start()
+
+    def _next_delay(self, elapsed: float) -> float:
+        """
+        Aim checks at the quantiles of previously observed build durations; once
+        past the known distribution (or without history) back off geometrically.
+        """
+        samples = self._samples()
+        if len(samples) >= MIN_SAMPLES:
+            for q in SCHEDULE_QUANTILES:
+                target = _quantile(samples, q)
+                if target >= elapsed + self.min_interval:
+                    return min(target - elapsed, self.max_interval)
+        return min(max(self.min_interval, elapsed * 0.25), self.max_interval)
+
+    def _finish(self, watch: PagesWatch, live: bool, exact: bool = False) -> None:
+        if live and (watch.learn or exact):
+            with self._cond:
+                self._durations.append(time.time() - watch.registered_at)
+        watch.finish(live)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due_at, _, watch = self._heap[0]
+                now = time.time()
+                if due_at > now:
+                    self._cond.wait(due_at - now)
+                    continue
+                heapq.heappop(self._heap)
+
+            if watch.done:
+                continue
+            if time.time() >= watch.deadline:
+                watch.finish(False)
+                continue
+            self._executor.submit(self._check, watch)
+
+    def _check(self, watch: PagesWatch) -> None:
+        watch.checks += 1
+        try:
+            live = bool(watch.check())
+        except Exception as e:
+            print(f"Pages check for {watch.key} failed: {str(e)}")
+            live = False
+
+        if watch.done:
+            return
+        if live:
+            print(
+                f"GitHub Pages is live at: {watch.key} "
+                f"(after {time.time() - watch.registered_at:.0f}s, {watch.checks} check(s))"
+            )
+            self._finish(watch, True)
+            return
+
+        elapsed = time.time() - watch.registered_at
+        next_check = min(time.time() + self._next_delay(elapsed), watch.deadline)
+        print(f"Still building: {watch.key} (next check in {next_check - time.time():.0f}s)")
+        with self._cond:
+            heapq.heappush(self._heap, (next_check, next(self._seq), watch))
+            self._cond.notify()
+
+
+def _quantile(samples: List[float], q: float) -> float:
+    index = min(len(samples) - 1, max(0, int(round(q * (len(samples) - 1)))))
+    return samples[index]
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_pages_poller() -> PagesPoller:
+    global _poller
+    if _poller is None:
+        with _poller_lock:
+            if _poller is None:
+                _poller = PagesPoller()
+    return _poller
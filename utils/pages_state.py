@@ -0,0 +1,93 @@
+"""
+Persisted record of repositories whose GitHub Pages site we already configured.
+ensure_pages_site() consults it before calling the Pages API, so later rounds
+skip the GET + POST/PATCH round trips. An entry is dropped when GitHub answers
+404 for the repository or its site, or reports a different source.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .config import PAGES_STATE_PATH
+
+
+class PagesStateStore:
+    def __init__(self, path: str):
+        """
+        Args:
+            path: JSON file holding {"owner/repo": {"branch", "path", "verified_at"}}
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            return entries if isinstance(entries, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable Pages state file {self.path}: {str(e)}")
+            return {}
+
+    def _save(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _key(owner: str, repo_name: str) -> str:
+        return f"{owner}/{repo_name}".lower()
+
+    def is_configured(self, owner: str, repo_name: str, branch: str, path: str = "/") -> bool:
+        with self._lock:
+            entry = self._entries.get(self._key(owner, repo_name))
+        return entry is not None and entry.get("branch") == branch and entry.get("path") == path
+
+    def mark_configured(self, owner: str, repo_name: str, branch: str, path: str = "/") -> None:
+        with self._lock:
+            self._entries[self._key(owner, repo_name)] = {
+                "branch": branch,
+                "path": path,
+                "verified_at": time.time(),
+            }
+            try:
+                self._save()
+            except OSError as e:
+                print(f"Warning: Could not persist Pages state: {str(e)}")
+
+    def invalidate(self, owner: str, repo_name: str) -> None:
+        with self._lock:
+            if self._entries.pop(self._key(owner, repo_name), None) is None:
+                return
+            try:
+                self._save()
+            except OSError as e:
+                print(f"Warning: Could not persist Pages state: {str(e)}")
+
+
+_pages_state = None
+_pages_state_lock = threading.Lock()
+
+
+def get_pages_state() -> Optional[PagesStateStore]:
+    """Shared store, or None when PAGES_STATE_PATH is empty."""
+    global _pages_state
+    if _pages_state is None and PAGES_STATE_PATH:
+        with _pages_state_lock:
+            if _pages_state is None:
+                _pages_state = PagesStateStore(PAGES_STATE_PATH)
+    return _pages_state
@@ -0,0 +1,114 @@
+"""
+SEARCH/REPLACE edit blocks for revising an existing document.
+The model answers with blocks of the form
+
+    <<<<<<< SEARCH
+    exact lines from the current document
+    =======
+    lines to put in their place
+    >>>>>>> REPLACE
+
+which are parsed, applied in order and checked before the result is used.
+"""
+import re
+from typing import List, Tuple
+
+_BLOCK_RE = re.compile(
+    r"<{5,9} ?SEARCH[^\n]*\n(.*?)\n?={5,9}[ \t]*\n(.*?)\n?>{5,9} ?REPLACE",
+    re.DOTALL,
+)
+
+
+class PatchError(ValueError):
+    """Raised when edits cannot be parsed or applied unambiguously."""
+
+
+def parse_search_replace(text: str) -> List[Tuple[str, str]]:
+    """Return the (search, replace) pairs found in a model response."""
+    text = text.replace("\r\n", "\n")
+    return [(m.group(1), m.group(2)) for m in _BLOCK_RE.finditer(text)]
+
+
+def _find_lines(document: str, search: str) -> Tuple[int, int]:
+    """
+    Locate search in document line by line, ignoring leading and trailing
+    whitespace on each line and blank lines, so edits written against a
+    compacted view of the document still apply to the original.
+    Returns the (start, end) character span.
+    """
+    doc_lines = document.splitlines(keepends=True)
+    wanted = [line.strip() for line in search.splitlines() if line.strip()]
+    if not wanted:
+        raise PatchError("Empty SEARCH block")
+
+    offsets = []
+    position = 0
+    for line in doc_lines:
+        offsets.append(position)
+        position += len(line)
+    # Indices of the non-blank document lines
+    content = [i for i, line in enumerate(doc_lines) if line.strip()]
+    stripped = [doc_lines[i].strip() for i in content]
+    matches = [
+        k
+        for k in range(len(stripped) - len(wanted) + 1)
+        if stripped[k:k + len(wanted)] == wanted
+    ]
+    if not matches:
+        raise PatchError(f"SEARCH block not found: {search.strip()[:80]!r}")
+    if len(matches) > 1:
+        raise PatchError(f"SEARCH block is ambiguous ({len(matches)} matches): {search.strip()[:80]!r}")
+
+    first = content[matches[0]]
+    last = content[matches[0] + len(wanted) - 1]
+    start = offsets[first]
+    end = offsets[last] + len(doc_lines[last])
+    # Keep the line break after the matched block in place
+    if doc_lines[last].endswith("\n"):
+        end -= 1
+    return start, end
+
+
+def apply_search_replace(document: str, edits: List[Tuple[str, str]]) -> str:
+    """
+    Apply edits in order. Each SEARCH text must match exactly once, either
+    verbatim or line by line with surrounding whitespace ignored.
+
+    Raises:
+        PatchError: if there are no edits or one does not match exactly once
+    """
+    if not edits:
+        raise PatchError("No SEARCH/REPLACE blocks found")
+
+    for search, replace in edits:
+        if not search.strip():
+            raise PatchError("Empty SEARCH block")
+        count = document.count(search)
+        if count == 1:
+            document = document.replace(search, replace, 1)
+            continue
+        if count > 1:
+            raise PatchError(f"SEARCH block is ambiguous ({count} matches): {search.strip()[:80]!r}")
+        start, end = _find_lines(document, search)
+        document = document[:start] + replace + document[end:]
+    return document
+
+
+def verify_html(original: str, revised: str) -> None:
+    """
+    Cheap structural checks that an edited document is still complete.
+
+    Raises:
+        PatchError: describing the first problem found
+    """
+    lower = revised.lower()
+    if not lower.strip():
+        raise PatchError("Patched document is empty")
+    for tag in ("html", "body", "head"):
+        if f"</{tag}>" in original.lower() and f"</{tag}>" not in lower:
+            raise PatchError(f"Patched document lost its </{tag}> tag")
+    for tag in ("script", "style"):
+        opened = len(re.findall(rf"<{tag}[\s>]", lower))
+        closed = lower.count(f"</{tag}>")
+        if opened != closed:
+            raise PatchError(f"Unbalanced <{tag}> tags after patching ({opened} opened, {closed} closed)")
@@ -0,0 +1,114 @@
+"""
+Minimal dependency-graph executor for the request pipeline.
+Stages whose dependencies are satisfied run concurrently on a thread pool and
+the wall-clock timing of every stage is recorded.
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Dict[str, Any]], Any],
+        deps: Iterable[str] = (),
+        required: bool = True,
+    ):
+        """
+        Args:
+            name: Unique stage name, also the key of its result
+            fn: Called with the results of all finished stages
+            deps: Names of stages that must finish first
+            required: If False, a failure is logged and the result is None
+                instead of aborting the pipeline
+        """
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.required = required
+
+
+class PipelineError(RuntimeError):
+    def __init__(self, stage: str, error: BaseException):
+        super().__init__(str(error))
+        self.stage = stage
+        self.error = error
+
+
+def run_pipeline(
+    stages: List[Stage],
+    max_workers: int = 4,
+    on_stage_start: Optional[Callable[[str], None]] = None,
+    on_stage_finish: Optional[Callable[[str, str, Optional[str]], None]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """
+    Execute stages in dependency order, overlapping independent ones.
+
+    Returns:
+        Tuple of (results by stage name, duration in seconds by stage name)
+
+    Raises:
+        PipelineError: when a required stage fails; stages already running are
+            allowed to finish, stages not yet started are skipped
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+
+    results: Dict[str, Any] = {}
+    timings: Dict[str, float] = {}
+    done: set = set()
+    started: set = set()
+    running: Dict[Any, Tuple[Stage, float]] = {}
+    failure: Optional[PipelineError] = None
+
+    def execute(stage: Stage) -> Any:
+        return stage.fn(dict(results))
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage") as pool:
+        while True:
+            if failure is None:
+                for stage in stages:
+                    if stage.name in started:
+                        continue
+                    if all(dep in done for dep in stage.deps):
+                        started.add(stage.name)
+                        if on_stage_start is not None:
+                            on_stage_start(stage.name)
+                        running[pool.submit(execute, stage)] = (stage, time.time())
+
+            if not running:
+                break
+
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, started_at = running.pop(future)
+                timings[stage.name] = time.time() - started_at
+                error = future.exception()
+                if error is None:
+                    results[stage.name] = future.result()
+                    status = "completed"
+                elif stage.required:
+                    status = "failed"
+                    if failure is None:
+                        failure = PipelineError(stage.name, error)
+                else:
+                    print(f"Warning: Stage '{stage.name}' failed: {str(error)}")
+                    results[stage.name] = None
+                    status = "failed"
+                done.add(stage.name)
+                if on_stage_finish is not None:
+                    on_stage_finish(stage.name, status, str(error) if error else None)
+
+    if failure is not None:
+        raise failure
+
+    unfinished = [stage.name for stage in stages if stage.name not in done]
+    if unfinished:
+        raise ValueError(f"Pipeline has a dependency cycle involving: {', '.join(unfinished)}")
+
+    return results, timings
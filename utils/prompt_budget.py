@@ -0,0 +1,100 @@
+"""
+Token budgeting for prompt assembly.
+Each prompt component offers its content at decreasing levels of detail
+(e.g. full → summary → preview → reference). Components are downgraded one
+level at a time, least important and largest first, until the estimated
+prompt size fits the configured budget.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .config import PROMPT_TOKEN_BUDGET
+
+# Roughly four characters per token for English text and code
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class PromptComponent:
+    def __init__(self, name: str, levels: Sequence[Tuple[str, str]], priority: int = 0):
+        """
+        Args:
+            name: Identifier used in the result and in log output
+            levels: (level name, text) pairs, most detailed first
+            priority: Higher priorities are downgraded later
+        """
+        if not levels:
+            raise ValueError(f"Prompt component '{name}' has no levels")
+        self.name = name
+        self.levels = list(levels)
+        self.priority = priority
+        self.level = 0
+        self._tokens = [estimate_tokens(text) for _, text in self.levels]
+
+    @property
+    def text(self) -> str:
+        return self.levels[self.level][1]
+
+    @property
+    def level_name(self) -> str:
+        return self.levels[self.level][0]
+
+    @property
+    def tokens(self) -> int:
+        return self._tokens[self.level]
+
+    def can_downgrade(self) -> bool:
+        return self.level < len(self.levels) - 1
+
+    def downgrade(self) -> None:
+        self.level += 1
+
+
+def fit_to_budget(
+    components: List[PromptComponent],
+    budget: int,
+) -> Tuple[Dict[str, PromptComponent], int]:
+    """
+    Downgrade components until their total estimated size fits budget.
+
+    Returns:
+        Tuple of (components by name, estimated total tokens). The total can
+        still exceed budget when every component is at its smallest level.
+    """
+    total = sum(component.tokens for component in components)
+    while total > budget:
+        candidates = [c for c in components if c.can_downgrade()]
+        if not candidates:
+            break
+        component = min(candidates, key=lambda c: (c.priority, -c.tokens))
+        before = component.tokens
+        component.downgrade()
+        total -= before - component.tokens
+    return {component.name: component for component in components}, total
+
+
+def plan_prompt(
+    fixed_text: str,
+    components: List[PromptComponent],
+    budget: Optional[int] = None,
+) -> Tuple[Dict[str, PromptComponent], Dict[str, object]]:
+    """
+    Fit components into what is left of the budget after fixed_text.
+
+    Returns:
+        Tuple of (components by name, stats with budget, estimated tokens and
+        the level of every downgraded component)
+    """
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+    fixed_tokens = estimate_tokens(fixed_text)
+    planned, used = fit_to_budget(components, max(0, budget - fixed_tokens))
+    stats = {
+        "prompt_budget_tokens": budget,
+        "prompt_tokens_estimate": fixed_tokens + used,
+        "downgraded": {
+            c.name: c.level_name for c in components if c.level > 0
+        },
+    }
+    return planned, stats
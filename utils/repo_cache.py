@@ -0,0 +1,76 @@
+"""
+Process-wide cache of the authenticated GitHub login and repository handles.
+Handles are lazy PyGithub objects, so obtaining one issues no request; entries
+expire after REPO_CACHE_TTL seconds and are dropped when GitHub answers 404.
+"""
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from .config import get_github_client, REPO_CACHE_TTL
+
+
+class RepoCache:
+    def __init__(self, ttl: float = REPO_CACHE_TTL):
+        self.ttl = ttl
+        self._login: Optional[str] = None
+        # full name -> (repo, verified, expires_at)
+        self._repos: Dict[str, Tuple[object, bool, float]] = {}
+        self._lock = threading.Lock()
+
+    def login(self) -> str:
+        """Login of the token owner. Fetched once per process."""
+        if self._login is None:
+            login = get_github_client().get_user().login
+            with self._lock:
+                self._login = login
+        return self._login
+
+    def get(self, task: str, owner: Optional[str] = None, verify: bool = False):
+        """
+        Return a handle for owner/task (owner defaults to the token owner).
+
+        Args:
+            verify: If True, make sure the repository exists. This costs one GET
+                unless a verified handle is cached.
+
+        Raises:
+            GithubException: with status 404 when verify is set and the
+                repository does not exist
+        """
+        full_name = f"{owner or self.login()}/{task}"
+        now = time.time()
+        with self._lock:
+            entry = self._repos.get(full_name)
+        if entry is not None and entry[2] > now and (entry[1] or not verify):
+            return entry[0]
+
+        gh = get_github_client()
+        repo = gh.get_repo(full_name, lazy=not verify)
+        with self._lock:
+            self._repos[full_name] = (repo, verify, now + self.ttl)
+        return repo
+
+    def put(self, task: str, repo, owner: Optional[str] = None) -> None:
+        """Remember a repository object known to exist (e.g. just created)."""
+        full_name = f"{owner or self.login()}/{task}"
+        with self._lock:
+            self._repos[full_name] = (repo, True, time.time() + self.ttl)
+
+    def invalidate(self, task: str, owner: Optional[str] = None) -> None:
+        full_name = f"{owner or self.login()}/{task}"
+        with self._lock:
+            self._repos.pop(full_name, None)
+
+
+_repo_cache = None
+_repo_cache_lock = threading.Lock()
+
+
+def get_repo_cache() -> RepoCache:
+    global _repo_cache
+    if _repo_cache is None:
+        with _repo_cache_lock:
+            if _repo_cache is None:
+                _repo_cache = RepoCache()
+    return _repo_cache
@@ -0,0 +1,181 @@
+"""
+Per-task serialization of deployments.
+Requests for the same task run one at a time, lowest round first, while
+different tasks proceed in parallel. A round older than the one already
+deployed is rejected instead of overwriting it. With TASK_LOCK_DIR set, an
+fcntl lock file per task extends this across worker processes.
+Idle tasks are remembered for stale-round checks up to MAX_IDLE_TASKS, least
+recently used first out; past that, only the lock files (if any) remember them.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+from .config import TASK_LOCK_DIR, TASK_LOCK_TIMEOUT
+
+MAX_IDLE_TASKS = 1024
+
+
+class TaskLockTimeout(RuntimeError):
+    """Raised when a task stays busy for longer than the lock timeout."""
+
+
+class StaleRoundError(RuntimeError):
+    def __init__(self, task: str, round_num: int, deployed_round: int):
+        super().__init__(
+            f"Round {round_num} of task '{task}' is older than the already deployed round {deployed_round}"
+        )
+        self.task = task
+        self.round_num = round_num
+        self.deployed_round = deployed_round
+
+
+class _TaskState:
+    def __init__(self):
+        self.busy = False
+        self.waiting: list = []
+        self.deployed_round = 0
+        self.lock_file = None
+
+
+class TaskLockManager:
+    def __init__(self, lock_dir: str = TASK_LOCK_DIR, timeout: float = TASK_LOCK_TIMEOUT):
+        """
+        Args:
+            lock_dir: Directory for cross-process lock files ("" for in-process only)
+            timeout: Maximum seconds to wait for a task to become free
+        """
+        self.lock_dir = lock_dir if fcntl is not None else ""
+        self.timeout = timeout
+        self._tasks: "OrderedDict[str, _TaskState]" = OrderedDict()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    @contextmanager
+    def hold(self, task: str, round_num: int):
+        """
+        Run the body with exclusive access to task.
+
+        Raises:
+            StaleRoundError: if a later round of task was already deployed
+            TaskLockTimeout: if the task stayed busy for longer than the timeout
+        """
+        deadline = time.time() + self.timeout
+        ticket = (round_num, next(self._seq))
+
+        with self._cond:
+            state = self._tasks.setdefault(task, _TaskState())
+            if round_num < state.deployed_round:
+                raise StaleRoundError(task, round_num, state.deployed_round)
+            heapq.heappush(state.waiting, ticket)
+            try:
+                while state.busy or state.waiting[0] != ticket:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise TaskLockTimeout(
+                            f"Task '{task}' is busy with another deployment, try again later"
+                        )
+                    self._cond.wait(remaining)
+            except BaseException:
+                state.waiting.remove(ticket)
+                heapq.heapify(state.waiting)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(state.waiting)
+            state.busy = True
+
+        try:
+            if self.lock_dir:
+                state.lock_file = self._lock_file(task, deadline)
+                state.deployed_round = max(
+                    state.deployed_round, self._read_round(state.lock_file)
+                )
+            if round_num < state.deployed_round:
+                raise StaleRoundError(task, round_num, state.deployed_round)
+            yield
+        finally:
+            if state.lock_file is not None:
+                fcntl.flock(state.lock_file, fcntl.LOCK_UN)
+                state.lock_file.close()
+                state.lock_file = None
+            with self._cond:
+                state.busy = False
+                if not state.waiting and not state.deployed_round:
+                    self._tasks.pop(task, None)
+                elif task in self._tasks:
+                    self._tasks.move_to_end(task)
+                self._prune()
+                self._cond.notify_all()
+
+    def mark_deployed(self, task: str, round_num: int) -> None:
+        """Record that round_num of task is live. Call while holding the task."""
+        with self._cond:
+            state = self._tasks.setdefault(task, _TaskState())
+            state.deployed_round = max(state.deployed_round, round_num)
+            lock_file = state.lock_file
+            deployed_round = state.deployed_round
+        if lock_file is not None:
+            lock_file.seek(0)
+            lock_file.truncate()
+            lock_file.write(str(deployed_round))
+            lock_file.flush()
+
+    def _prune(self) -> None:
+        """Forget the least recently used idle tasks beyond MAX_IDLE_TASKS. Call with _cond held."""
+        excess = len(self._tasks) - MAX_IDLE_TASKS
+        if excess <= 0:
+            return
+        for task in list(self._tasks):
+            if excess <= 0:
+                break
+            state = self._tasks[task]
+            if not state.busy and not state.waiting:
+                del self._tasks[task]
+                excess -= 1
+
+    def _lock_file(self, task: str, deadline: float):
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in task)
+        lock_file = open(os.path.join(self.lock_dir, f"{safe}.lock"), "a+")
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return lock_file
+            except BlockingIOError:
+                if time.time() >= deadline:
+                    lock_file.close()
+                    raise TaskLockTimeout(
+                        f"Task '{task}' is locked by another worker, try again later"
+                    )
+                time.sleep(0.2)
+
+    @staticmethod
+    def _read_round(lock_file) -> int:
+        lock_file.seek(0)
+        try:
+            return int(lock_file.read().strip() or 0)
+        except ValueError:
+            return 0
+
+
+_task_locks = None
+_task_locks_lock = threading.Lock()
+
+
+def get_task_locks() -> TaskLockManager:
+    global _task_locks
+    if _task_locks is None:
+        with _task_locks_lock:
+            if _task_locks is None:
+                _task_locks = TaskLockManager()
+    return _task_locks
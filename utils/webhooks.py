@@ -0,0 +1,106 @@
+"""
+GitHub webhook handling.
+Repositories we create get a hook for page_build and push events pointing at
+WEBHOOK_URL. A page_build event completes the deployments waiting on that
+build straight away; polling the builds API remains as a fallback. A push that
+moves a branch away from our last deployment drops the local copy of it.
+"""
+import hashlib
+import hmac
+from typing import Any, Dict, Optional
+
+from .artifact_store import get_artifact_store
+from .config import GITHUB_WEBHOOK_SECRET, WEBHOOK_URL
+from .pages_poller import get_pages_poller
+
+WEBHOOK_EVENTS = ["page_build", "push"]
+
+
+def webhooks_enabled() -> bool:
+    return bool(WEBHOOK_URL and GITHUB_WEBHOOK_SECRET)
+
+
+def sign_payload(body: bytes, secret: str = GITHUB_WEBHOOK_SECRET) -> str:
+    """Value GitHub sends in X-Hub-Signature-256 for body."""
+    digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+def verify_signature(body: bytes, signature: Optional[str], secret: str = GITHUB_WEBHOOK_SECRET) -> bool:
+    if not secret or not signature:
+        return False
+    return hmac.compare_digest(sign_payload(body, secret), signature)
+
+
+def register_webhook(repo) -> bool:
+    """
+    Subscribe WEBHOOK_URL to page_build and push events of repo.
+
+    Returns:
+        True if the hook was created
+    """
+    if not webhooks_enabled():
+        return False
+    try:
+        repo.create_hook(
+            "web",
+            {
+                "url": WEBHOOK_URL,
+                "content_type": "json",
+                "secret": GITHUB_WEBHOOK_SECRET,
+                "insecure_ssl": "0",
+            },
+            events=WEBHOOK_EVENTS,
+            active=True,
+        )
+        print(f"Registered webhook for {repo.full_name}")
+        return True
+    except Exception as e:
+        print(f"Warning: Could not register webhook, Pages readiness will be polled: {str(e)}")
+        return False
+
+
+def _pages_url(full_name: str) -> str:
+    owner, repo_name = full_name.split("/", 1)
+    return f"https://{owner}.github.io/{repo_name}/"
+
+
+def handle_github_event(event: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Act on a verified webhook delivery.
+
+    Returns:
+        Dict describing what was done, for the HTTP response
+    """
+    full_name = (payload.get("repository") or {}).get("full_name")
+    if event == "ping":
+        return {"event": event, "action": "pong"}
+    if not full_name or "/" not in full_name:
+        return {"event": event, "action": "ignored", "reason": "no repository"}
+
+    if event == "page_build":
+        build = payload.get("build") or {}
+        status = build.get("status")
+        commit = build.get("commit")
+        if status not in ("built", "errored"):
+            return {"event": event, "action": "ignored", "status": status}
+        woken = get_pages_poller().resolve(
+            _pages_url(full_name), live=status == "built", commit=commit
+        )
+        print(f"page_build {status} for {full_name} at {str(commit)[:7]}, woke {woken} waiting deployment(s)")
+        return {"event": event, "action": "resolved", "status": status, "woken": woken}
+
+    if event == "push":
+        store = get_artifact_store()
+        repo_name = full_name.split("/", 1)[1]
+        manifest = store.get_manifest(repo_name) if store is not None else None
+        if (
+            manifest is not None
+            and payload.get("ref") == "refs/heads/main"
+            and payload.get("after") != manifest["commit_sha"]
+        ):
+            store.forget(repo_name)
+            return {"event": event, "action": "forgot stored deployment"}
+        return {"event": event, "action": "none"}
+
+    return {"event": event, "action": "ignored"}